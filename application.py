@@ -12,8 +12,6 @@ import logging
 import warnings
 import seaborn as sns
 
-import cProfile
-import pstats
 import io
 import re
 
@@ -27,7 +25,21 @@ import matplotlib.dates as mdates
 from functools import partial, wraps
 
 from src.simulation import NCCU_Model, Simulate
-from modules.data_loader import read_data
+from src.parameters import SimulationParameters
+from src.replication import run_replications
+from src.sequential_runs import run_until_precise
+from src.background_run import BackgroundRun
+from src.warm_up import chosen_warm_up
+from src.scenario import run_scenario, scenario_options
+from src.profiling import EngineProfile, write_profile
+from src.result_cache import ResultCache, result_cache_key
+from src.capacity_sweep import run_capacity_sweep, load_sweep_results, SWEEP_PARAMETERS, SWEEP_KPIS
+from src.unit_parameters import UNIT_NAMES
+from modules.data_loader import read_data, write_data
+from modules.plots import (plot_resource_utilization, plot_queue_length, plot_available_capacity,
+                           plot_admission_discharge_trends_moving_avg, plot_daywise_resource_utilization,
+                           plot_probability_full, plot_occupancy_fan_chart, plot_sweep_heatmap,
+                           cached_results_cube, results_cube)
 from modules.read_config import read_config
 from modules.logger_configurator import configure_logger
 
@@ -49,6 +61,11 @@ logger = logging.getLogger(__name__)
 
 global resource_monitor_data_path
 resource_monitor_data_path = config['data']['resource_data']
+patient_log_path = config['data']['patient_log']
+sweep_results_path = config['data']['sweep_results']
+random_state = config['info']['random_state']
+result_cache = ResultCache(config['cache']['directory'], config['cache']['max_size_mb'] * 2 ** 20)
+profiling_enabled = config.get('profiling', {}).get('enabled', False)
 
 
 # Initialize session state variables
@@ -80,196 +97,6 @@ def show_login_page():
             st.error("Invalid username or password.")
 
    
-# ==================================================
-# ===================== Plots ======================
-# ==================================================
-           
-def plot_resource_utilization(data):
-
-    mean_NICU = data[data['Resource'] == 'NICU']['Daily_Use'].mean()
-    mean_HDCU = data[data['Resource'] == 'HDCU']['Daily_Use'].mean()
-    mean_SCBU = data[data['Resource'] == 'SCBU']['Daily_Use'].mean()
-
-    # Display the metrics
-    with st.container(border=True):
-        st.info(" Average Utilization by Resource")
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            st.metric(label="Average NICU", value=f"{mean_NICU:.2f}")
-        with col2:
-            st.metric(label="Average HDCU", value=f"{mean_HDCU:.2f}")
-        with col3:
-            st.metric(label="Average SCBU", value=f"{mean_SCBU:.2f}")
-
-        col1, col2, col3 = st.columns(3)
-
-    fig = go.Figure()
-
-    resources = data['Resource'].unique()
-    for resource in resources:
-        resource_data = data[data['Resource'] == resource]
-
-        mean_line = resource_data.groupby('Day')['Daily_Use'].mean().reset_index()
-        fig.add_trace(go.Scatter(x=mean_line['Day'], y=mean_line['Daily_Use'], 
-                                 mode='lines', name=f'{resource} Mean', line=dict(width=3)))
-
-    fig.update_layout(title='Resource Utilization Over Time', xaxis_title='Day', yaxis_title='Average Daily Use')
-    st.plotly_chart(fig)   
-
-
-
-
-def plot_queue_length(data):
-    queue_len_NICU = data[data['Resource'] == 'NICU']['Queue_Length'].mean()
-    queue_len_HDCU = data[data['Resource'] == 'HDCU']['Queue_Length'].mean()
-    queue_len_SCBU = data[data['Resource'] == 'SCBU']['Queue_Length'].mean()
-
-    # Display the metrics
-    with st.container(border=True):
-        st.info("Average Queue Length by Resource")
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            st.metric(label="Average NICU", value=f"{queue_len_NICU:.2f}")
-        with col2:
-            st.metric(label="Average HDCU", value=f"{queue_len_HDCU:.2f}")
-        with col3:
-            st.metric(label="Average SCBU", value=f"{queue_len_SCBU:.2f}")
-
-    fig = go.Figure()
-
-    resources = data['Resource'].unique()
-    for resource in resources:
-        resource_data = data[data['Resource'] == resource]
-
-        mean_line = resource_data.groupby('Day')['Queue_Length'].mean().reset_index()
-        fig.add_trace(go.Scatter(x=mean_line['Day'], y=mean_line['Queue_Length'], 
-                                 mode='lines', name=f'{resource} Mean', line=dict(width=3)))
-
-    fig.update_layout(title='Queue Length Over Time', xaxis_title='Day', yaxis_title='Average Queue Length')
-    st.plotly_chart(fig)
-        
-def plot_available_capacity(data):
-    Available_Capacity_NICU = data[data['Resource'] == 'NICU']['Available_Capacity'].mean()
-    Available_Capacity_HDCU = data[data['Resource'] == 'HDCU']['Available_Capacity'].mean()
-    Available_Capacity_SCBU = data[data['Resource'] == 'SCBU']['Available_Capacity'].mean()
-
-    # Display the metrics
-    with st.container(border=True):
-        st.info("Average Available Capacity by Resource")
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            st.metric(label="Average NICU", value=f"{Available_Capacity_NICU:.2f}")
-        with col2:
-            st.metric(label="Average HDCU", value=f"{Available_Capacity_HDCU:.2f}")
-        with col3:
-            st.metric(label="Average SCBU", value=f"{Available_Capacity_SCBU:.2f}")
-
-    fig = go.Figure()
-
-    resources = data['Resource'].unique()
-    for resource in resources:
-        resource_data = data[data['Resource'] == resource]
-
-        mean_line = resource_data.groupby('Day')['Available_Capacity'].mean().reset_index()
-        fig.add_trace(go.Scatter(x=mean_line['Day'], y=mean_line['Available_Capacity'], 
-                                 mode='lines', name=f'{resource} Mean', line=dict(width=3)))
-
-    fig.update_layout(title='Available Capacity for Neonatal Care Units Over Time', 
-                      xaxis_title='Day', yaxis_title='Available Capacity')
-    st.plotly_chart(fig)
-    
-def plot_admission_discharge_trends_moving_avg(data):
-    colors = {'NICU': 'blue', 'HDCU': 'red', 'SCBU': 'green'}
-    daily_use = data.groupby(['Day', 'Resource'])['Daily_Use'].sum().unstack()
-    admissions = daily_use.diff().clip(lower=0)
-    discharges = -daily_use.diff().clip(upper=0)
-
-    admissions_avg = admissions.rolling(window=7).mean().melt(ignore_index=False, var_name='Resource', value_name='Admissions').reset_index()
-    discharges_avg = discharges.rolling(window=7).mean().melt(ignore_index=False, var_name='Resource', value_name='Discharges').reset_index()
-
-    Avg_Admission_NICU = admissions_avg[admissions_avg['Resource'] == 'NICU']['Admissions'].mean()
-    Avg_Admission_HDCU = admissions_avg[admissions_avg['Resource'] == 'HDCU']['Admissions'].mean()
-    Avg_Admission_SCBU = admissions_avg[admissions_avg['Resource'] == 'SCBU']['Admissions'].mean()
-
-    Avg_Discharge_NICU = discharges_avg[discharges_avg['Resource'] == 'NICU']['Discharges'].mean()
-    Avg_Discharge_HDCU = discharges_avg[discharges_avg['Resource'] == 'HDCU']['Discharges'].mean()
-    Avg_Discharge_SCBU = discharges_avg[discharges_avg['Resource'] == 'SCBU']['Discharges'].mean()
-
-    fig = go.Figure()
-
-    with st.container(border=True):
-        st.info("Average Admissions and Discharges by Resource")
-
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            st.metric(label="NICU Admissions", value=f"{Avg_Admission_NICU:.2f}")
-        with col2:
-            st.metric(label="HDCU Admissions", value=f"{Avg_Admission_HDCU:.2f}")
-        with col3:
-            st.metric(label="SCBU Admissions", value=f"{Avg_Admission_SCBU:.2f}")
-
-        col4, col5, col6 = st.columns(3)
-        with col4:
-            st.metric(label="NICU Discharges", value=f"{Avg_Discharge_NICU:.2f}")
-        with col5:
-            st.metric(label="HDCU Discharges", value=f"{Avg_Discharge_HDCU:.2f}")
-        with col6:
-            st.metric(label="SCBU Discharges", value=f"{Avg_Discharge_SCBU:.2f}")
-
-    # Plot for admissions and discharges
-    for resource in admissions_avg['Resource'].unique():
-        admissions_data = admissions_avg[admissions_avg['Resource'] == resource]
-        discharges_data = discharges_avg[discharges_avg['Resource'] == resource]
-
-        # Admissions
-        fig.add_trace(go.Scatter(x=admissions_data['Day'], y=admissions_data['Admissions'], mode='lines+markers', 
-                                 name=f'{resource} Admissions', #line=dict(color=colors[resource], width=2), 
-                                 marker=dict(symbol='circle')))
-        
-        # Discharges
-        fig.add_trace(go.Scatter(x=discharges_data['Day'], y=discharges_data['Discharges'], mode='lines+markers', 
-                                 name=f'{resource} Discharges', #line=dict(color=colors[resource], width=2), 
-                                 marker=dict(symbol='x')))
-
-    fig.update_layout(title='7-Day Moving Average of Admissions and Discharges by Resource', 
-                      xaxis_title='Day', yaxis_title='7-Day Moving Average', 
-                      legend_title='Category')
-    st.plotly_chart(fig)
-
-def plot_daywise_resource_utilization(data):
-    data['Utilization_Rate'] = data['Daily_Use'] / data['Total_Capacity']
-
-    avg_utilization_NICU = data[data['Resource'] == 'NICU']['Utilization_Rate'].mean()
-    avg_utilization_HDCU = data[data['Resource'] == 'HDCU']['Utilization_Rate'].mean()
-    avg_utilization_SCBU = data[data['Resource'] == 'SCBU']['Utilization_Rate'].mean()
-
-    with st.container(border=True):
-        st.info("Average Utilization Rate by Resource")
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            st.metric(label="NICU", value=f"{avg_utilization_NICU:.2f}")
-        with col2:
-            st.metric(label="HDCU", value=f"{avg_utilization_HDCU:.2f}")
-        with col3:
-            st.metric(label="SCBU", value=f"{avg_utilization_SCBU:.2f}")
-
-    fig = go.Figure()
-    colors = {'NICU': 'blue', 'HDCU': 'red', 'SCBU': 'green'}
-
-    # Calculate and plot the daily average for each resource
-    resources = data['Resource'].unique()
-    for resource in resources:
-        resource_data = data[data['Resource'] == resource]
-        daily_avg = resource_data.groupby('Day')['Utilization_Rate'].mean().reset_index()
-        fig.add_trace(go.Scatter(x=daily_avg['Day'], y=daily_avg['Utilization_Rate'], mode='lines', name=f'{resource} Average'))
-
-    # Update the layout
-    fig.update_layout(title='Average Daily Resource Utilization Rate',
-                      xaxis_title='Day',
-                      yaxis_title='Utilization Rate',
-                      legend_title='Resource')
-    st.plotly_chart(fig)
-
 st.set_page_config(page_title="Simulation Demo", page_icon="📈")
 
 # ==================================================
@@ -423,6 +250,7 @@ def modify_parameters_page():
 
     if st.button('Verify'):
         if authenticate_user(username, password):
+            st.session_state['admin'] = True
             st.markdown("### Parameters/Configuration")
             yaml_file_path = 'parameters.yaml'
 
@@ -439,6 +267,127 @@ def modify_parameters_page():
         else:
             st.error("Invalid username or password.")
 
+    if st.session_state.get('admin'):
+        with st.container(border=True):
+            st.info("### Profiling")
+            st.session_state['profile_runs'] = st.toggle(
+                "Profile simulation runs", value=st.session_state.get('profile_runs', profiling_enabled),
+                help="""Count SimPy events, processes and cot requests and time the arrival, admission and 
+                monitoring code of every run. The report is shown with the results and saved next to them""")
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def describe_results(scenario_key, _data, columns):
+    return _data[list(columns)].describe()
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def convert_df(scenario_key, _df):
+    # IMPORTANT: Cache the conversion to prevent computation on every rerun
+    return _df.to_csv().encode('utf-8')
+
+def show_results(results):
+    # Draws a finished run's results. Everything derived from the data is cached
+    # under its scenario key, so widget changes here only redraw.
+    scenario_key = results['scenario_key']
+    data = results['data']
+    summarise_runs = results['summarised']
+    precision = results['precision']
+
+    if results['from_cache']:
+        st.info("Loaded the results of an identical earlier run")
+    if results['stopped']:
+        st.warning(f"Stopped after {results['completed_runs']} runs. These partial results are not saved")
+    st.info(f"Total simulation time: {results['duration']:.2f} seconds")
+
+    warm_up_report = results['warm_up_report']
+    if warm_up_report is not None:
+        if warm_up_report['Reliable'].all():
+            st.info(f"Warm up of {results['warm_up']} days detected from {warm_up_report['Pilot_Runs'].iloc[0]} pilot runs")
+        else:
+            st.warning(f"Occupancy had not settled in the pilot runs, so the warm up of {results['warm_up']} days was kept. "
+                       "A longer simulation duration gives the pilot runs more time")
+        st.dataframe(warm_up_report)
+
+    census_report = results['census_report']
+    if census_report is not None:
+        st.info(f"Runs started from a steady-state census of {census_report['Census_Runs'].iloc[0]} pilot runs "
+                f"at day {census_report['Census_Day'].iloc[0]}")
+        st.dataframe(census_report)
+
+    if results['profile'] is not None:
+        st.info(f"Engine profile of {results['profile'].runs} runs")
+        st.dataframe(results['profile'].to_dataframe())
+
+    if precision is not None:
+        runs_needed = precision['Runs'].iloc[0]
+        if precision['Met'].all():
+            st.success(f"Every precision target was met after {runs_needed} runs")
+        elif not results['stopped']:
+            st.warning(f"Not every precision target was met within the maximum of {runs_needed} runs")
+        st.dataframe(precision)
+
+    # Every chart and metric below reads this per-day, per-resource cube
+    cube = cached_results_cube(scenario_key, data)
+
+    st.header("Simulation Results Visualization")
+
+    st.subheader("Resource Utilization Over Time")
+    plot_resource_utilization(cube, scenario_key)
+
+    st.subheader("Queue Length Over Time")
+    plot_queue_length(cube, scenario_key)
+
+    st.subheader("Available Capacity Over Time")
+    plot_available_capacity(cube, scenario_key)
+
+    st.subheader("Inferred Admission and Discharge Trends")
+    plot_admission_discharge_trends_moving_avg(cube, scenario_key)
+
+    st.subheader("Day-wise Resource Utilization")
+    plot_daywise_resource_utilization(cube, scenario_key)
+
+    if summarise_runs:
+        st.subheader("Risk of a Full Unit")
+        plot_probability_full(cube, scenario_key)
+
+        st.subheader("Occupancy Bands Across Runs")
+        for resource in cube['Resource'].unique():
+            plot_occupancy_fan_chart(cube, resource, scenario_key)
+
+    with st.container(border=True):
+        st.info("*//Experimental//*")
+        st.subheader("Summary Statistics of Data")
+
+        # Filter options for displaying fields
+        all_columns = data.columns.tolist()
+        selected_columns = st.multiselect("Select fields to display", all_columns, default=all_columns)
+
+        # Display only selected fields in the summary statistics
+        data_desc = describe_results(scenario_key, data, tuple(selected_columns))
+        st.dataframe(data_desc)
+
+        ### KPIs
+        metric1, metric2 = st.columns(2, gap='small')
+        if 'Utilization_Rate' in selected_columns:
+            average_utilization = (cube['Utilization_Rate'] * cube['Runs']).sum() / cube['Runs'].sum()
+            with metric1:
+                st.info('Average Utilization')
+                st.metric(label="Average Utilization", value=f"{average_utilization:,.4f}")
+
+        if 'Queue_Length' in selected_columns:
+            max_queue_length = cube['Queue_Length_Max'].max()
+            with metric2:
+                st.info('Max Queue Length')
+                st.metric(label="Max Queue Length", value=f"{max_queue_length:,.0f}")
+
+    csv = convert_df(scenario_key, data)
+
+    st.download_button(
+        label="Download data as CSV",
+        data=csv,
+        file_name='Simulation_data.csv',
+        mime='text/csv',
+    )
+
 def main_app():
 
     with st.sidebar:
@@ -453,10 +402,52 @@ def main_app():
                                                 doors with an empty unit a large number of days will help us 
                                                 account for existing patients of varying 
                                                 lengths of stay duration""", 0, 1000, 100, step=1) #None, None, 100, step=1
+            detect_warm_up_mode = st.checkbox("Detect the warm up from pilot runs", value=False,
+                                              help="""Run a few pilot simulations from empty units first and set the warm 
+                                              up to the day their average occupancy settles (MSER-5). The number of 
+                                              days recorded after the warm up stays the same""")
+            if detect_warm_up_mode:
+                pilot_runs = st.number_input("Number of pilot runs", 2, 100, 10, step=1)
+            # The census is taken at the end of the warm up, so it needs one
+            census_unavailable = sim_params_instance.warm_up_duration < 1 and not detect_warm_up_mode
+            census_mode = st.checkbox("Start from a steady-state census", value=False,
+                                      disabled=census_unavailable,
+                                      help="""Fill the units at the start of every run with the babies and remaining 
+                                      stays of a unit that has been open for the warm up, sampled from pilot runs. 
+                                      Runs then record from the first day and skip simulating the warm up. 
+                                      Needs a warm up of at least one day""") and not census_unavailable
+            if census_mode:
+                census_runs = st.number_input("Number of census pilot runs", 10, 5000, 200, step=10)
             sim_params_instance.sim_duration = st.number_input("Simulation duration - days", 0, 1000, 300, step=1)  # None, None, 300, step=1
             sim_params_instance.number_of_runs = st.number_input("""Number of times to run the simulation. We run the simulation many 
                                                 times and then average out the results to account for busy periods 
                                                 and slow periods that can occur in stochastic modelling)""", 1, 100, 50, step=1) #  1, None, 50, step=1
+            run_until_precise_mode = st.checkbox("Run until results are precise", value=False,
+                                                 help="""Keep adding runs in batches until the 95% confidence interval of 
+                                                 every unit's mean utilisation and queue length is narrow enough, 
+                                                 instead of a fixed number of runs""")
+            if run_until_precise_mode:
+                utilization_half_width = st.number_input("Target half-width for mean utilisation rate", 0.001, 1.0, 0.02,
+                                                         step=0.005, format="%.3f")
+                queue_half_width = st.number_input("Target half-width for mean queue length", 0.01, 10.0, 0.5,
+                                                   step=0.05)
+                max_runs = st.number_input("Maximum number of runs", 10, 2000, 500, step=10)
+            engine_label = st.radio("Simulation engine", ["Discrete event (SimPy)", "Batched (NumPy)"],
+                                    help="""The batched engine steps every run together in whole days 
+                                    and is much faster for large numbers of runs""")
+            engine = "batch" if engine_label == "Batched (NumPy)" else "simpy"
+            max_workers = os.cpu_count() or 1
+            number_of_workers = st.number_input("""Number of worker processes - runs are spread over this many CPU cores. 
+                                                Set to 1 to run every simulation in this process, which is easier to debug""", 1, max_workers, max_workers, step=1)
+            summarise_runs = st.checkbox("Summarise runs as they finish", value=False,
+                                         help="""Keep only the per-day mean, spread, percentiles and chance of being 
+                                         full of each unit across runs instead of every row of every run. Memory no longer grows 
+                                         with the number of runs, but the raw data is not saved""")
+            trace_patients = st.checkbox("Trace patient journeys", value=False,
+                                         disabled=engine == "batch" or run_until_precise_mode,
+                                         help=f"""Log every admission, transfer and discharge with its queue time 
+                                         to {patient_log_path}. Only available with the discrete event engine 
+                                         and a fixed number of runs""")
 
         with tab2:
             st.markdown("""Here we can set our unit parameters""")
@@ -491,129 +482,322 @@ def main_app():
         submit_button = st.form_submit_button(label='Run simulations')
         stop_button = st.form_submit_button(label='Stop Simulation')
 
-    if submit_button:
-        start_time = time.time()
-        progress_bar=st.progress(0)
-        with st.spinner('Running simulations...'):
-
-            # pr = cProfile.Profile()
-            # pr.enable()
-
-            Simulate(sim_params_instance)
-            
-            total_runs = sim_params_instance.number_of_runs
-      
-         
-
-            all_runs_data = pd.DataFrame()  # Initialize all_runs_data
-            for run in range(total_runs):
-
-                # Update the progress bar
-                progress_percentage = int((run / total_runs) * 100)
-                progress_bar.progress(progress_percentage)
-                
-                try:
-                    NCCU_model_instance = NCCU_Model(sim_params_instance)
-                    NCCU_model_instance.run()
-                    all_runs_data = pd.concat([all_runs_data, NCCU_model_instance.resource_monitor_df])
-                except Exception as e:
-                    logger.error(f"Error in simulation run {run + 1}: {e}")
-
-                progress_bar.progress(100)
-
-            # pr.disable()
-            # s = io.StringIO()
-            # sortby = 'cumulative'
-            # ps = pstats.Stats(pr, stream=s).sort_stats(sortby)
-            # ps.print_stats()
-            # print(s.getvalue())  
-
-            # with open("cprofile.txt", "w") as file:
-            #     file.write(s.getvalue())
-
-            end_time = time.time()  # End time
-            total_duration = end_time - start_time  # Total duration
-
-            st.info(f"Total simulation time: {total_duration:.2f} seconds")
-
-            data = all_runs_data
-            data['Utilization_Rate'] = data['Daily_Use'] / data['Total_Capacity']
-
-            st.header("Simulation Results Visualization")
-
-            st.subheader("Resource Utilization Over Time")
-            plot_resource_utilization(all_runs_data)
-
-            st.subheader("Queue Length Over Time")
-            plot_queue_length(all_runs_data)
-
-            st.subheader("Available Capacity Over Time")
-            plot_available_capacity(all_runs_data)
-
-            st.subheader("Inferred Admission and Discharge Trends")
-            plot_admission_discharge_trends_moving_avg(data)
-
-            st.subheader("Day-wise Resource Utilization")
-            plot_daywise_resource_utilization(data)
+    if stop_button and 'job' in st.session_state:
+        st.session_state['job']['run'].cancel()
 
-            with st.container(border=True):
-                st.info("*//Experimental//*")
-                st.subheader("Summary Statistics of Data")
-
-                # Filter options for displaying fields
-                all_columns = data.columns.tolist()
-                selected_columns = st.multiselect("Select fields to display", all_columns, default=all_columns)
-
-                # Display only selected fields in the summary statistics
-                data_desc = data[selected_columns].describe()
-                st.dataframe(data_desc)
-
-                # # Check if plots are initialized
-                # if not st.session_state.plot_initialized:
-                #     # Plotting code (this will run only once or when explicitly updated)
-                #     plot_data()
-                #     st.session_state.plot_initialized = True
-
-                ### KPIs
-                if 'Utilization_Rate' in selected_columns:
-                    average_utilization = data['Utilization_Rate'].mean()
-                    metric1, metric2 = st.columns(2, gap='small')
-                    with metric1:
-                        st.info('Average Utilization')
-                        st.metric(label="Average Utilization", value=f"{average_utilization:,.4f}")
-                
-                if 'Queue_Length' in selected_columns:
-                    max_queue_length = data['Queue_Length'].max()
-                    with metric2:
-                        st.info('Max Queue Length')
-                        st.metric(label="Max Queue Length", value=f"{max_queue_length:,.0f}")
+    if submit_button and 'job' in st.session_state:
+        st.warning("A simulation is already running. Stop it or wait for it to finish before starting another")
+    elif submit_button:
+        start_time = time.time()
 
-                
+        # Frozen copy for the background run, the sidebar keeps changing sim_params_instance
+        run_params = Simulate(sim_params_instance)
+        total_runs = sim_params_instance.number_of_runs
+
+        profile = EngineProfile(engine) if st.session_state.get('profile_runs', profiling_enabled) else None
+
+        # Warm-up detection and the census run in the background job with the
+        # simulation, so the cache is keyed on the settings that lead to them
+        pilot_options = scenario_options(pilot_runs if detect_warm_up_mode else None,
+                                         census_runs if census_mode else None)
+
+        precision_targets = None
+        if run_until_precise_mode:
+            precision_targets = {}
+            for unit in UNIT_NAMES:
+                precision_targets[(unit, 'Utilization_Rate')] = utilization_half_width
+                precision_targets[(unit, 'Queue_Length')] = queue_half_width
+            scenario_key = result_cache_key(run_params, engine, random_state,
+                                            precision_targets=sorted(precision_targets.items()),
+                                            max_runs=max_runs, aggregate=summarise_runs, **pilot_options)
+        else:
+            scenario_key = result_cache_key(run_params, engine, random_state,
+                                            number_of_runs=total_runs, aggregate=summarise_runs, **pilot_options)
+
+        # A traced run has to happen to write its patient log
+        trace_run = trace_patients and engine == "simpy" and not run_until_precise_mode
+        cached = None
+        if not run_until_precise_mode and not trace_run:
+            cached = cached_scenario(scenario_key, run_params.warm_up_duration, detect_warm_up_mode, census_mode)
+
+        if cached is not None:
+            st.session_state['results'] = {
+                'scenario_key': scenario_key,
+                'precision': None,
+                'summarised': summarise_runs,
+                'from_cache': True,
+                'stopped': False,
+                'completed_runs': total_runs,
+                'profile': None,
+                'duration': time.time() - start_time,
+                **cached,
+            }
+            st.success('Done!')
+        else:
+            scenario_settings = dict(pilot_runs=pilot_runs if detect_warm_up_mode else None,
+                                     census_runs=census_runs if census_mode else None,
+                                     workers=number_of_workers, engine=engine, random_state=random_state,
+                                     aggregate=summarise_runs, profile=profile)
+            if run_until_precise_mode:
+                run = BackgroundRun(run_scenario, run_until_precise, run_params, precision_targets,
+                                    min_runs=min(10, max_runs), max_runs=max_runs,
+                                    total_runs=max_runs, **scenario_settings)
+            else:
+                run = BackgroundRun(run_scenario, run_replications, run_params, total_runs,
+                                    patient_log_path=patient_log_path if trace_run else None,
+                                    total_runs=total_runs, **scenario_settings)
+            # The simulation carries on in the background over the reruns
+            # below; finish_background_run picks up its result once it is done
+            st.session_state['job'] = {
+                'run': run,
+                'scenario_key': scenario_key,
+                'engine': engine,
+                'summarised': summarise_runs,
+                'precision_mode': run_until_precise_mode,
+                'precision_targets': precision_targets,
+                'pilot_runs': detect_warm_up_mode or census_mode,
+                'profile': profile,
+                'start_time': start_time,
+            }
+            st.session_state['running'] = True
+            st.session_state.pop('results', None)
+
+    if 'job' in st.session_state:
+        if st.session_state['job']['run'].done:
+            finish_background_run()
+        else:
+            show_background_run()
+
+    if 'results' in st.session_state:
+        show_results(st.session_state['results'])
+
+@st.fragment(run_every=1)
+def show_background_run():
+    # Redrawn every second on its own while the simulation runs, with the
+    # charts of the runs finished so far. Once it is done the whole page reruns
+    # to show the final results.
+    job = st.session_state.get('job')
+    if job is None:
+        return
+    run = job['run']
+    if run.done:
+        st.rerun()
 
+    completed_runs, total_runs, partial_data = run.snapshot()
+    if run.cancelled:
+        st.info("Stopping after the runs already underway...")
+    st.progress(completed_runs / total_runs if total_runs else 0.0,
+                text=f"Running simulations... {completed_runs} of {total_runs} runs finished")
+    if completed_runs == 0 and job['pilot_runs']:
+        st.caption("The pilot runs for the warm up and census come first")
+
+    if partial_data is not None and not partial_data.empty:
+        st.header(f"Partial Results from {partial_data['Runs'].max()} Runs")
+        cube = results_cube(partial_data)
+        st.subheader("Resource Utilization Over Time")
+        plot_resource_utilization(cube)
+        st.subheader("Queue Length Over Time")
+        plot_queue_length(cube)
+
+def finish_background_run():
+    # Moves a finished background run into the results. Stopped runs are shown
+    # but neither cached nor saved, as they are not the scenario that was asked for.
+    job = st.session_state.pop('job')
+    st.session_state['running'] = False
+    run = job['run']
+    if run.error is not None:
+        st.error(f"The simulation failed: {run.error}")
+        return
+
+    scenario_run = run.result
+    if job['precision_mode']:
+        data, precision = scenario_run['result']
+    else:
+        data, precision = scenario_run['result'], None
+    if data.empty:
+        if run.cancelled:
+            st.warning("Stopped before any run finished")
+        else:
+            st.warning("The simulation recorded no data, check the simulation duration is longer than the warm up")
+        return
+
+    summarise_runs = job['summarised']
+    completed_runs = int(data['Runs'].max()) if summarise_runs else data['Run_Number'].nunique()
+    stopped = run.cancelled
+    # The charts and tables of the results are cached under their scenario key,
+    # so partial results get a key of their own and never stand in for the full ones
+    scenario_key = f"{job['scenario_key']}:stopped:{completed_runs}" if stopped else job['scenario_key']
+    st.session_state['results'] = {
+        'scenario_key': scenario_key,
+        'data': data,
+        'precision': precision,
+        'summarised': summarise_runs,
+        'from_cache': False,
+        'stopped': stopped,
+        'completed_runs': completed_runs,
+        'warm_up': scenario_run['warm_up'],
+        'warm_up_report': scenario_run['warm_up_report'],
+        'census_report': scenario_run['census_report'],
+        'profile': job['profile'],
+        'duration': time.time() - job['start_time'],
+    }
+    if stopped:
+        return
+
+    warm_up_report = scenario_run['warm_up_report']
+    census_report = scenario_run['census_report']
+    if not job['precision_mode']:
+        result_cache.put(job['scenario_key'], data)
+        if warm_up_report is not None:
+            result_cache.put(f"{job['scenario_key']}-warm-up", warm_up_report)
+        if census_report is not None:
+            result_cache.put(f"{job['scenario_key']}-census", census_report)
+    st.success('Done!')
+
+    precision_targets = job['precision_targets']
+    scenario = {
+        'scenario_key': job['scenario_key'],
+        'simulation_parameters': scenario_run['sim_params'].as_dict(),
+        'engine': job['engine'],
+        'random_state': random_state,
+        'summarised': summarise_runs,
+        'precision_targets': [[*target, half_width] for target, half_width in precision_targets.items()]
+                             if precision_targets is not None else None,
+        'warm_up_detection': warm_up_report.to_dict('records') if warm_up_report is not None else None,
+        'census': census_report.to_dict('records') if census_report is not None else None,
+    }
+    if not summarise_runs:
+        write_data(data, resource_monitor_data_path, scenario)
+    if job['profile'] is not None:
+        write_profile(job['profile'], resource_monitor_data_path, scenario)
+
+
+def cached_scenario(scenario_key, configured_warm_up, detect_warm_up_mode, census_mode):
+    # The cached results of a scenario with the reports of its pilot runs, or
+    # None unless every one of them is still in the cache
+    warm_up = configured_warm_up
+    warm_up_report = None
+    if detect_warm_up_mode:
+        warm_up_report = result_cache.get(f"{scenario_key}-warm-up")
+        if warm_up_report is None:
+            return None
+        warm_up = chosen_warm_up(warm_up_report, configured_warm_up)
+    census_report = None
+    if census_mode:
+        census_report = result_cache.get(f"{scenario_key}-census")
+        if census_report is None:
+            return None
+    data = result_cache.get(scenario_key)
+    if data is None:
+        return None
+    return {'data': data, 'warm_up': warm_up, 'warm_up_report': warm_up_report, 'census_report': census_report}
 
 
-            @st.cache_data
-            def convert_df(df):
-                # IMPORTANT: Cache the conversion to prevent computation on every rerun
-                return df.to_csv().encode('utf-8')
+# ==================================================
+# ================= Capacity Sweep =================
+# ==================================================
 
-            csv = convert_df(data)
+def capacity_sweep_page():
+    st.header("Capacity Planning Sweep", divider='rainbow')
+    st.markdown("""Run every combination of cot numbers and birth rates below and compare the units' 
+                average utilisation, queue length and chance of being full. The other settings are 
+                the run settings in parameters.yaml. Finished combinations are saved as they complete, so an 
+                interrupted sweep carries on where it stopped when run again.""")
+
+    with st.form(key='sweep_form'):
+        NICU_cots = st.slider("NICU cots", 1, 10, (2, 5))
+        HDCU_cots = st.slider("LCU cots", 1, 10, (2, 5))
+        SCBU_cots = st.slider("SCBU cots", 1, 20, (12, 12))
+        birth_rates = st.text_input("Annual birth rates, separated by commas", "3000")
+        runs_per_cell = st.number_input("Runs per combination", 1, 500, 20, step=1)
+        max_workers = os.cpu_count() or 1
+        number_of_workers = st.number_input("Number of worker processes", 1, max_workers, max_workers, step=1)
+        sweep_button = st.form_submit_button(label='Run sweep')
+        stop_button = st.form_submit_button(label='Stop sweep')
+
+    if stop_button and 'sweep_job' in st.session_state:
+        st.session_state['sweep_job']['run'].cancel()
+
+    if sweep_button and 'sweep_job' in st.session_state:
+        st.warning("A sweep is already running. Stop it or wait for it to finish before starting another")
+    elif sweep_button:
+        grid = {
+            'number_of_NICU_cots': list(range(NICU_cots[0], NICU_cots[1] + 1)),
+            'number_of_HDCU_cots': list(range(HDCU_cots[0], HDCU_cots[1] + 1)),
+            'number_of_SCBU_cots': list(range(SCBU_cots[0], SCBU_cots[1] + 1)),
+            'annual_birth_rate': [int(rate) for rate in re.split(r'[,\s]+', birth_rates.strip()) if rate],
+        }
+        sweep_params = SimulationParameters.from_config(config)
+        # Runs in the background like the main app's simulations; cells are
+        # saved as they finish, so a stopped sweep resumes from them
+        run = BackgroundRun(run_capacity_sweep, sweep_params, grid, runs_per_cell, sweep_results_path,
+                            workers=number_of_workers, random_state=random_state)
+        st.session_state['sweep_job'] = {'run': run, 'start_time': time.time()}
+        st.session_state.pop('sweep_results', None)
+
+    if 'sweep_job' in st.session_state:
+        if st.session_state['sweep_job']['run'].done:
+            finish_sweep_run()
+        else:
+            show_sweep_run()
+            return
 
-            st.download_button(
-                label="Download data as CSV",
-                data=csv,
-                file_name='Simulation_data.csv',
-                mime='text/csv',
-            )
-            # ax.legend()
+    results = st.session_state.get('sweep_results')
+    if results is None:
+        results = load_sweep_results(sweep_results_path)
+    if results.empty:
+        return
+
+    st.subheader("Results")
+    kpi_columns = [f"{unit}_{kpi}" for unit in UNIT_NAMES for kpi in SWEEP_KPIS]
+    kpi = st.selectbox("KPI", kpi_columns)
+    x_axis = st.selectbox("Across", SWEEP_PARAMETERS, index=0)
+    y_axis = st.selectbox("Down", SWEEP_PARAMETERS, index=1)
+
+    # Remaining swept parameters are fixed at one value each
+    filtered = results
+    for name in SWEEP_PARAMETERS:
+        if name not in (x_axis, y_axis) and filtered[name].nunique() > 1:
+            value = st.selectbox(name.replace('_', ' '), sorted(filtered[name].unique()))
+            filtered = filtered[filtered[name] == value]
+
+    if x_axis == y_axis:
+        st.warning("Choose two different parameters for the heatmap")
+    else:
+        plot_sweep_heatmap(filtered, kpi, x_axis, y_axis)
+    st.dataframe(results.drop(columns=['Sweep_Key']))
+
+
+@st.fragment(run_every=1)
+def show_sweep_run():
+    # Redrawn every second with the cells finished so far, then reruns the
+    # page once the sweep is done
+    job = st.session_state.get('sweep_job')
+    if job is None:
+        return
+    run = job['run']
+    if run.done:
+        st.rerun()
 
-            # st.pyplot(fig)
-        st.success('Done!')
+    completed_cells, total_cells, partial_results = run.snapshot()
+    if run.cancelled:
+        st.info("Stopping after the combinations already underway...")
+    st.progress(completed_cells / total_cells if total_cells else 0.0,
+                text=f"Running sweep... {completed_cells} of {total_cells or '?'} combinations finished")
+    if partial_results is not None and not partial_results.empty:
+        st.dataframe(partial_results.drop(columns=['Sweep_Key']))
 
-        data.to_csv(resource_monitor_data_path)
 
-    if stop_button:
-        st.session_state['running'] = False
+def finish_sweep_run():
+    job = st.session_state.pop('sweep_job')
+    run = job['run']
+    if run.error is not None:
+        st.error(f"The sweep failed: {run.error}")
+        return
+    st.session_state['sweep_results'] = run.result
+    if run.cancelled:
+        st.warning("Sweep stopped. The finished combinations are saved and running the sweep again carries on from them")
+    st.info(f"Total sweep time: {time.time() - job['start_time']:.2f} seconds")
 
 
 def display_agreement():
@@ -642,11 +826,13 @@ if True: # st.session_state['logged_in']:
         st.sidebar.image('./NECS_Cropped_Dots.png', caption=None, width=200, use_column_width=None, clamp=False, channels="RGB", output_format="auto")
         # st.sidebar.divider()
         st.sidebar.header("Navigation", divider='rainbow')
-        page = st.sidebar.radio("Select a Page", ["Main App", "Modify Parameters", "Submit Your Feedback"])
+        page = st.sidebar.radio("Select a Page", ["Main App", "Capacity Sweep", "Modify Parameters", "Submit Your Feedback"])
         # st.sidebar.divider()
 
         if  page == "Main App":
             main_app()
+        elif page == "Capacity Sweep":
+            capacity_sweep_page()
         elif page == "Modify Parameters":
             modify_parameters_page()
         elif page == "Submit Your Feedback":
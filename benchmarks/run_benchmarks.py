@@ -0,0 +1,258 @@
+"""Benchmarks for the simulation engines and the result charts.
+
+Run from the repository root, where parameters.yaml lives:
+
+    python -m benchmarks.run_benchmarks --quick
+    python -m benchmarks.run_benchmarks --output baseline.json
+    python -m benchmarks.run_benchmarks --compare baseline.json --threshold 0.15
+
+Every case of the grid is run once with each engine, timed, then run again under
+tracemalloc for its peak memory. The charts of modules.plots are timed on the
+output of each case when streamlit and plotly are installed.
+"""
+import argparse
+import itertools
+import json
+import logging
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import pandas as pd
+
+from modules.read_config import read_config
+from src.batch_engine import NCCU_Batch_Model
+from src.parameters import SimulationParameters
+from src.random_streams import RandomStreams, replication_seed
+from src.simulation import NCCU_Model
+
+GRID = {
+    "sim_duration": [300, 1000],
+    "annual_birth_rate": [3000, 6000],
+    "cots": [(3, 3, 12), (6, 6, 20)],
+    "number_of_runs": [10, 50],
+}
+QUICK_GRID = {
+    "sim_duration": [300],
+    "annual_birth_rate": [3000],
+    "cots": [(3, 3, 12)],
+    "number_of_runs": [10],
+}
+ENGINES = ("simpy", "batch")
+
+# Metrics compared against a baseline, and whether higher values are better
+COMPARED_METRICS = {"replications_per_s": True, "peak_memory_mb": False, "charts_s": False}
+
+
+def grid_cases(grid):
+    keys = list(grid)
+    for values in itertools.product(*(grid[key] for key in keys)):
+        yield dict(zip(keys, values))
+
+
+def case_parameters(config, case):
+    nicu, hdcu, scbu = case["cots"]
+    return SimulationParameters.from_config(
+        config,
+        sim_duration=case["sim_duration"],
+        warm_up_duration=min(config["run_settings"]["warm_up_duration"], case["sim_duration"] // 3),
+        annual_birth_rate=case["annual_birth_rate"],
+        number_of_NICU_cots=nicu,
+        number_of_HDCU_cots=hdcu,
+        number_of_SCBU_cots=scbu,
+        number_of_runs=case["number_of_runs"],
+    )
+
+
+def run_simpy(params, count_events=False):
+    # Returns the merged monitor data and the number of SimPy events processed
+    frames, events = [], 0
+    for run_number in range(1, params.number_of_runs + 1):
+        model = NCCU_Model(params, run_number=run_number, streams=RandomStreams(replication_seed(0, run_number)))
+        if count_events:
+            step = model.env.step
+
+            def counted_step():
+                nonlocal events
+                events += 1
+                step()
+
+            model.env.step = counted_step
+        model.run()
+        frames.append(model.resource_monitor_df)
+    return pd.concat(frames), events
+
+
+def run_batch(params, count_events=False):
+    model = NCCU_Batch_Model(params, seed=0)
+    model.run()
+    return model.resource_monitor_df, None
+
+
+ENGINE_RUNNERS = {"simpy": run_simpy, "batch": run_batch}
+
+
+def peak_memory_mb(function, *args):
+    tracemalloc.start()
+    try:
+        function(*args)
+        return tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+
+
+def chart_functions():
+    # None when the chart dependencies are missing
+    try:
+        import streamlit  # noqa: F401
+        import plotly  # noqa: F401
+    except ImportError:
+        return None
+    # Importing the cached chart functions outside `streamlit run` warns too
+    logging.disable(logging.WARNING)
+    try:
+        from modules import plots
+    finally:
+        logging.disable(logging.NOTSET)
+    return plots.results_cube, {
+        "resource_utilization": plots.plot_resource_utilization,
+        "queue_length": plots.plot_queue_length,
+        "available_capacity": plots.plot_available_capacity,
+        "admission_discharge_trends": plots.plot_admission_discharge_trends_moving_avg,
+        "daywise_resource_utilization": plots.plot_daywise_resource_utilization,
+    }
+
+
+def time_charts(charts, data):
+    # The main page builds the results cube once and draws every chart from it
+    results_cube, plot_functions = charts
+    timings = {}
+    # Outside `streamlit run` every st call is a no-op apart from a warning
+    logging.disable(logging.WARNING)
+    try:
+        start = time.perf_counter()
+        cube = results_cube(data)
+        timings["results_cube"] = time.perf_counter() - start
+        for name, plot in plot_functions.items():
+            start = time.perf_counter()
+            plot(cube)
+            timings[name] = time.perf_counter() - start
+    finally:
+        logging.disable(logging.NOTSET)
+    return timings
+
+
+def benchmark_case(config, engine, case, charts):
+    params = case_parameters(config, case)
+    runner = ENGINE_RUNNERS[engine]
+
+    start = time.perf_counter()
+    data, events = runner(params, True)
+    wall = time.perf_counter() - start
+
+    result = {
+        "engine": engine,
+        "case": {**case, "cots": list(case["cots"])},
+        "wall_s": wall,
+        "replications_per_s": params.number_of_runs / wall,
+        "events": events,
+        "events_per_s": events / wall if events is not None else None,
+        "monitor_rows": len(data),
+        "peak_memory_mb": peak_memory_mb(runner, params),
+    }
+    if charts is not None:
+        result["charts"] = time_charts(charts, data)
+        result["charts_s"] = sum(result["charts"].values())
+    return result
+
+
+def case_key(result):
+    case = result["case"]
+    return (result["engine"],) + tuple(
+        tuple(value) if isinstance(value, list) else value for _, value in sorted(case.items())
+    )
+
+
+def compare(results, baseline, threshold):
+    # Returns a line per regression beyond threshold, as a fraction of the baseline
+    baseline_results = {case_key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        before = baseline_results.get(case_key(result))
+        if before is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            old, new = before.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (-change if higher_is_better else change) > threshold:
+                regressions.append(f"{result['engine']} {result['case']}: {metric} "
+                                   f"{old:.4g} -> {new:.4g} ({change:+.1%})")
+    return regressions
+
+
+def print_result(result):
+    case = result["case"]
+    line = (f"{result['engine']:<6} days={case['sim_duration']:<5} births={case['annual_birth_rate']:<5} "
+            f"cots={'/'.join(map(str, case['cots'])):<8} runs={case['number_of_runs']:<3} "
+            f"{result['wall_s']:8.3f}s {result['replications_per_s']:9.1f} reps/s "
+            f"{result['peak_memory_mb']:7.1f} MB")
+    if result["events_per_s"] is not None:
+        line += f" {result['events_per_s']:10.0f} events/s"
+    if "charts_s" in result:
+        line += f" charts {result['charts_s']:.3f}s"
+    print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the NCCU simulation engines and result charts")
+    parser.add_argument("--quick", action="store_true", help="run a single small case")
+    parser.add_argument("--engine", choices=ENGINES, action="append",
+                        help="engine to benchmark, may be repeated (default: both)")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file written by --output")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="relative slowdown counted as a regression (default: 0.15)")
+    args = parser.parse_args(argv)
+
+    config = read_config("parameters.yaml")
+    charts = chart_functions()
+    if charts is None:
+        print("streamlit or plotly not installed, charts are not benchmarked")
+
+    results = []
+    for case in grid_cases(QUICK_GRID if args.quick else GRID):
+        for engine in args.engine or ENGINES:
+            result = benchmark_case(config, engine, case, charts)
+            print_result(result)
+            results.append(result)
+
+    if args.output:
+        report = {
+            "meta": {
+                "created": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "pandas": pd.__version__,
+            },
+            "results": results,
+        }
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print(f"no regressions beyond {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
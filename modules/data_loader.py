@@ -1,26 +1,58 @@
 import os
+import json
 import logging
 import pyarrow as pa
 import pyarrow.parquet as pq
 
-## Reads Parquet data
-def read_data(directory):
+# Key of the scenario description in a results file's Parquet metadata
+SCENARIO_METADATA_KEY = b"nccu_scenario"
+
+## Writes results as compressed Parquet with the scenario they came from
+def write_data(data, file_path, scenario=None):
+    data_dir = os.path.dirname(file_path)
+    if data_dir:
+        os.makedirs(data_dir, exist_ok=True)
+
+    table = pa.Table.from_pandas(data, preserve_index=False)
+    if scenario is not None:
+        metadata = dict(table.schema.metadata or {})
+        metadata[SCENARIO_METADATA_KEY] = json.dumps(scenario, default=str).encode()
+        table = table.replace_schema_metadata(metadata)
+    pq.write_table(table, file_path, compression="zstd")
+    logging.info(f"Saved {len(data)} rows to {file_path}")
+
+## Returns the scenario embedded by write_data, or None
+def read_scenario(file_path):
+    metadata = pq.read_schema(file_path).metadata or {}
+    if SCENARIO_METADATA_KEY not in metadata:
+        return None
+    return json.loads(metadata[SCENARIO_METADATA_KEY])
+
+## Reads Parquet data, from a file or the first Parquet file in a directory.
+## Only the given columns are read when columns is set.
+def read_data(directory, columns=None):
     if not os.path.exists(directory):
         logging.warning(f"Directory {directory} does not exist.")
         return None,'None'
-    
-    for file in os.listdir(directory):
+
+    if os.path.isfile(directory):
+        files = [os.path.basename(directory)]
+        directory = os.path.dirname(directory)
+    else:
+        files = sorted(os.listdir(directory))
+
+    for file in files:
         if file.endswith(".parquet"):
             try:
                 file_path = os.path.join(directory, file)
-                parquet_table = pq.read_table(file_path)
+                parquet_table = pq.read_table(file_path, columns=columns)
                 df=parquet_table.to_pandas()
                 logging.info(f"Successfully read {file}, shape {df.shape}")
                 return df, file
-            
+
             except Exception as e:
                 logging.error(f"Error reading {file}: {e}")
                 continue
 
     logging.warning(f"No data file found in {directory}.")
-    return None, 'None'
\ No newline at end of file
+    return None, 'None'
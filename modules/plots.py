@@ -0,0 +1,233 @@
+import numpy as np
+import streamlit as st
+import plotly.graph_objects as go
+
+# Result charts for the main page. The merged resource monitor data of all
+# runs, or the per-day summary of them from ReplicationSummary, is reduced once
+# by results_cube, and each chart shows its headline metrics and draws a Plotly
+# figure from that cube.
+#
+# The *_chart functions only compute: they return the headline metrics as
+# (label, value) pairs and the figure. The plot_* functions show them, and
+# given the scenario_key of the results they reuse what was computed for that
+# scenario on an earlier rerun instead of computing it again.
+
+def results_cube(data):
+    # One row per (Day, Resource) with everything the charts and metrics read,
+    # built in a single grouping pass over the data: the number of runs, the
+    # mean over runs of each monitor column, the total use and the longest queue.
+    # The summarised data already has one row per day and resource, so only the
+    # total is added to a copy of it.
+    if 'Runs' in data:
+        cube = data.copy()
+        cube['Total_Use'] = cube['Daily_Use'] * cube['Runs']
+        return cube
+
+    grouped = data.groupby(['Day', 'Resource'], sort=False, observed=True)
+    group = grouped.ngroup().to_numpy()
+    runs = grouped.size()
+
+    cube = runs.index.to_frame(index=False)
+    cube['Runs'] = runs.to_numpy()
+    daily_use = data['Daily_Use'].to_numpy(dtype=np.float64)
+    for column in ('Daily_Use', 'Queue_Length', 'Available_Capacity', 'Total_Capacity'):
+        cube[column] = np.bincount(group, weights=data[column].to_numpy(dtype=np.float64)) / cube['Runs']
+    cube['Utilization_Rate'] = np.bincount(
+        group, weights=daily_use / data['Total_Capacity'].to_numpy()) / cube['Runs']
+    cube['Total_Use'] = np.bincount(group, weights=daily_use)
+    longest_queue = np.zeros(len(cube))
+    np.maximum.at(longest_queue, group, data['Queue_Length'].to_numpy(dtype=np.float64))
+    cube['Queue_Length_Max'] = longest_queue
+    return cube
+
+def resource_means(cube, column):
+    # Mean of a column over every run and day for each resource, as the full data would give it
+    weighted = (cube[column] * cube['Runs']).groupby(cube['Resource'], observed=True).sum()
+    return weighted / cube['Runs'].groupby(cube['Resource'], observed=True).sum()
+
+def resource_lines(cube, column, name):
+    # One trace per resource of a cube column over the days
+    return [go.Scatter(x=resource_cube['Day'], y=resource_cube[column], mode='lines',
+                       name=f'{resource} {name}', line=dict(width=3))
+            for resource, resource_cube in cube.groupby('Resource', sort=False, observed=True)]
+
+def resource_utilization_chart(cube):
+    means = resource_means(cube, 'Daily_Use')
+    metrics = [(f"Average {resource}", f"{means.get(resource, float('nan')):.2f}") for resource in ('NICU', 'HDCU', 'SCBU')]
+
+    fig = go.Figure(resource_lines(cube, 'Daily_Use', 'Mean'))
+    fig.update_layout(title='Resource Utilization Over Time', xaxis_title='Day', yaxis_title='Average Daily Use')
+    return metrics, fig
+
+def queue_length_chart(cube):
+    means = resource_means(cube, 'Queue_Length')
+    metrics = [(f"Average {resource}", f"{means.get(resource, float('nan')):.2f}") for resource in ('NICU', 'HDCU', 'SCBU')]
+
+    fig = go.Figure(resource_lines(cube, 'Queue_Length', 'Mean'))
+    fig.update_layout(title='Queue Length Over Time', xaxis_title='Day', yaxis_title='Average Queue Length')
+    return metrics, fig
+
+def available_capacity_chart(cube):
+    means = resource_means(cube, 'Available_Capacity')
+    metrics = [(f"Average {resource}", f"{means.get(resource, float('nan')):.2f}") for resource in ('NICU', 'HDCU', 'SCBU')]
+
+    fig = go.Figure(resource_lines(cube, 'Available_Capacity', 'Mean'))
+    fig.update_layout(title='Available Capacity for Neonatal Care Units Over Time',
+                      xaxis_title='Day', yaxis_title='Available Capacity')
+    return metrics, fig
+
+def admission_discharge_trends_chart(cube):
+    colors = {'NICU': 'blue', 'HDCU': 'red', 'SCBU': 'green'}
+    daily_use = cube.pivot(index='Day', columns='Resource', values='Total_Use').sort_index()
+    admissions = daily_use.diff().clip(lower=0)
+    discharges = -daily_use.diff().clip(upper=0)
+
+    admissions_avg = admissions.rolling(window=7).mean()
+    discharges_avg = discharges.rolling(window=7).mean()
+
+    metrics = [(f"{resource} Admissions", f"{admissions_avg[resource].mean():.2f}")
+               for resource in ('NICU', 'HDCU', 'SCBU') if resource in admissions_avg]
+    metrics += [(f"{resource} Discharges", f"{discharges_avg[resource].mean():.2f}")
+                for resource in ('NICU', 'HDCU', 'SCBU') if resource in discharges_avg]
+
+    fig = go.Figure()
+
+    # Plot for admissions and discharges
+    for resource in admissions_avg.columns:
+        # Admissions
+        fig.add_trace(go.Scatter(x=admissions_avg.index, y=admissions_avg[resource], mode='lines+markers',
+                                 name=f'{resource} Admissions', #line=dict(color=colors[resource], width=2),
+                                 marker=dict(symbol='circle')))
+
+        # Discharges
+        fig.add_trace(go.Scatter(x=discharges_avg.index, y=discharges_avg[resource], mode='lines+markers',
+                                 name=f'{resource} Discharges', #line=dict(color=colors[resource], width=2),
+                                 marker=dict(symbol='x')))
+
+    fig.update_layout(title='7-Day Moving Average of Admissions and Discharges by Resource',
+                      xaxis_title='Day', yaxis_title='7-Day Moving Average',
+                      legend_title='Category')
+    return metrics, fig
+
+def daywise_resource_utilization_chart(cube):
+    means = resource_means(cube, 'Utilization_Rate')
+    metrics = [(resource, f"{means.get(resource, float('nan')):.2f}") for resource in ('NICU', 'HDCU', 'SCBU')]
+
+    # Daily average for each resource
+    fig = go.Figure([go.Scatter(x=resource_cube['Day'], y=resource_cube['Utilization_Rate'], mode='lines',
+                                name=f'{resource} Average')
+                     for resource, resource_cube in cube.groupby('Resource', sort=False, observed=True)])
+
+    # Update the layout
+    fig.update_layout(title='Average Daily Resource Utilization Rate',
+                      xaxis_title='Day',
+                      yaxis_title='Utilization Rate',
+                      legend_title='Resource')
+    return metrics, fig
+
+def probability_full_chart(cube):
+    # Needs the cube of summarised data, which carries P_Full for every day and resource
+    mean_full = resource_means(cube, 'P_Full')
+    metrics = [(resource, f"{mean_full.get(resource, float('nan')):.1%}") for resource in ('NICU', 'HDCU', 'SCBU')]
+
+    fig = go.Figure([go.Scatter(x=resource_cube['Day'], y=resource_cube['P_Full'], mode='lines', name=resource)
+                     for resource, resource_cube in cube.groupby('Resource', sort=False, observed=True)])
+
+    fig.update_layout(title='Probability Each Unit is Full by Day', xaxis_title='Day',
+                      yaxis_title='Share of Runs at Capacity', yaxis_tickformat='.0%')
+    return metrics, fig
+
+def occupancy_fan_chart(cube, resource):
+    # Median occupancy of one unit with its 50% and 90% bands across runs
+    resource_data = cube[cube['Resource'] == resource]
+
+    fig = go.Figure()
+    for lower, upper, name in (('Daily_Use_P05', 'Daily_Use_P95', '90% of runs'),
+                               ('Daily_Use_P25', 'Daily_Use_P75', '50% of runs')):
+        fig.add_trace(go.Scatter(x=resource_data['Day'], y=resource_data[upper],
+                                 mode='lines', line=dict(width=0), showlegend=False))
+        fig.add_trace(go.Scatter(x=resource_data['Day'], y=resource_data[lower],
+                                 mode='lines', line=dict(width=0), fill='tonexty',
+                                 fillcolor='rgba(31, 119, 180, 0.2)', name=name))
+    fig.add_trace(go.Scatter(x=resource_data['Day'], y=resource_data['Daily_Use_P50'],
+                             mode='lines', name='Median', line=dict(width=3)))
+
+    fig.update_layout(title=f'{resource} Occupancy Across Runs', xaxis_title='Day', yaxis_title='Cots in Use')
+    return [], fig
+
+CHARTS = {
+    'resource_utilization': resource_utilization_chart,
+    'queue_length': queue_length_chart,
+    'available_capacity': available_capacity_chart,
+    'admission_discharge_trends': admission_discharge_trends_chart,
+    'daywise_resource_utilization': daywise_resource_utilization_chart,
+    'probability_full': probability_full_chart,
+    'occupancy_fan': occupancy_fan_chart,
+}
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def cached_results_cube(scenario_key, _data):
+    # _data is not hashed, the scenario key stands in for it
+    return results_cube(_data)
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def cached_chart(chart_name, scenario_key, _cube, *options):
+    return CHARTS[chart_name](_cube, *options)
+
+def chart(chart_name, cube, scenario_key=None, *options):
+    if scenario_key is None:
+        return CHARTS[chart_name](cube, *options)
+    return cached_chart(chart_name, scenario_key, cube, *options)
+
+def show_metrics(heading, metrics):
+    # Three metrics to a row under a heading
+    with st.container(border=True):
+        st.info(heading)
+        for row in range(0, len(metrics), 3):
+            for column, (label, value) in zip(st.columns(3), metrics[row:row + 3]):
+                with column:
+                    st.metric(label=label, value=value)
+
+def plot_resource_utilization(cube, scenario_key=None):
+    metrics, fig = chart('resource_utilization', cube, scenario_key)
+    show_metrics(" Average Utilization by Resource", metrics)
+    st.plotly_chart(fig)
+
+def plot_queue_length(cube, scenario_key=None):
+    metrics, fig = chart('queue_length', cube, scenario_key)
+    show_metrics("Average Queue Length by Resource", metrics)
+    st.plotly_chart(fig)
+
+def plot_available_capacity(cube, scenario_key=None):
+    metrics, fig = chart('available_capacity', cube, scenario_key)
+    show_metrics("Average Available Capacity by Resource", metrics)
+    st.plotly_chart(fig)
+
+def plot_admission_discharge_trends_moving_avg(cube, scenario_key=None):
+    metrics, fig = chart('admission_discharge_trends', cube, scenario_key)
+    show_metrics("Average Admissions and Discharges by Resource", metrics)
+    st.plotly_chart(fig)
+
+def plot_daywise_resource_utilization(cube, scenario_key=None):
+    metrics, fig = chart('daywise_resource_utilization', cube, scenario_key)
+    show_metrics("Average Utilization Rate by Resource", metrics)
+    st.plotly_chart(fig)
+
+def plot_probability_full(cube, scenario_key=None):
+    metrics, fig = chart('probability_full', cube, scenario_key)
+    show_metrics("Average Probability a Unit is Full", metrics)
+    st.plotly_chart(fig)
+
+def plot_occupancy_fan_chart(cube, resource, scenario_key=None):
+    _, fig = chart('occupancy_fan', cube, scenario_key, resource)
+    st.plotly_chart(fig)
+
+def plot_sweep_heatmap(results, kpi, x='number_of_NICU_cots', y='number_of_HDCU_cots'):
+    # One capacity sweep KPI over two swept parameters, averaged over any others
+    table = results.pivot_table(index=y, columns=x, values=kpi, aggfunc='mean')
+
+    fig = go.Figure(go.Heatmap(z=table.values, x=table.columns, y=table.index,
+                               colorscale='RdYlGn_r', colorbar=dict(title=kpi.replace('_', ' '))))
+    fig.update_layout(title=kpi.replace('_', ' '), xaxis_title=x.replace('_', ' '), yaxis_title=y.replace('_', ' '),
+                      xaxis=dict(type='category'), yaxis=dict(type='category'))
+    st.plotly_chart(fig)
@@ -27,9 +27,16 @@ setuptools.setup(
     packages=setuptools.find_packages(),
     python_requires=">=3.6",
     install_requires=[
-        "streamlit",
+        "streamlit>=1.37",
         'simpy',
         "pandas",
         "numpy",
+        "PyYaml",
+        "pyarrow",
     ],
+    entry_points={
+        "console_scripts": [
+            "nccu-sim=src.cli:main",
+        ],
+    },
 )
\ No newline at end of file
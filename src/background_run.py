@@ -0,0 +1,77 @@
+import logging
+import threading
+
+from src.replication_summary import ReplicationSummary
+
+logger = logging.getLogger(__name__)
+
+
+# Shared flag asking a long job to stop. Set from one thread (the Stop button)
+# and checked by the job between replications in another.
+class CancellationToken:
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+
+# Runs run_replications, run_until_precise, run_scenario or run_capacity_sweep
+# in a background thread, so the page that started it stays responsive. The
+# job is given its own cancellation token and callbacks; progress and a frame
+# of the results so far can be read at any time with snapshot().
+class BackgroundRun:
+    def __init__(self, run_function, *args, total_runs=None, **kwargs):
+        self.token = CancellationToken()
+        self.total_runs = total_runs
+        self.completed_runs = 0
+        self.partial_data = None
+        self.result = None
+        self.error = None
+        self._lock = threading.Lock()
+
+        kwargs.update(cancel_token=self.token, progress_callback=self._progress,
+                      partial_callback=self._partial)
+        self._thread = threading.Thread(target=self._run, args=(run_function, args, kwargs), daemon=True)
+        self._thread.start()
+
+    def _run(self, run_function, args, kwargs):
+        try:
+            self.result = run_function(*args, **kwargs)
+        except Exception as e:
+            logger.error(f"Background simulation failed: {e}")
+            self.error = e
+
+    def _progress(self, completed_runs, total_runs):
+        with self._lock:
+            self.completed_runs = completed_runs
+            self.total_runs = total_runs
+
+    def _partial(self, partial):
+        # Called on the job's thread, a summary of runs is turned into a frame
+        # there; a sweep passes its table of finished cells as it is
+        partial_data = partial.to_dataframe() if isinstance(partial, ReplicationSummary) else partial
+        with self._lock:
+            self.partial_data = partial_data
+
+    def snapshot(self):
+        with self._lock:
+            return self.completed_runs, self.total_runs, self.partial_data
+
+    def cancel(self):
+        self.token.cancel()
+
+    @property
+    def cancelled(self):
+        return self.token.cancelled
+
+    @property
+    def done(self):
+        return not self._thread.is_alive()
+
+    def join(self, timeout=None):
+        self._thread.join(timeout)
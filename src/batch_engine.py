@@ -0,0 +1,143 @@
+import numpy as np
+
+from src.parameters import SimulationParameters, first_need_probabilities, cot_stay_means
+from src.resource_monitor import monitor_frame
+from src.unit_parameters import UNIT_NAMES, ELIGIBLE_UNITS
+
+FREE = -1
+
+
+# Vectorised alternative to NCCU_Model. Time moves in whole days, so every
+# replication can be stepped together: each unit holds a (runs x cots) array of
+# the day each occupied cot is released, and each level of care keeps a count of
+# babies queuing for it. Waiting babies of one level are interchangeable (their
+# stay is only sampled on admission), so a count per run is a full FIFO queue.
+#
+# One simulated day follows the order SimPy processes NCCU_Model's events in:
+#   1. stays of two days or more ending today are released and refilled
+#   2. today's births arrive and take a free cot or join the queues
+#   3. the daily monitor records every unit
+#   4. the remaining releases due today happen and their cots are refilled
+# A cot taken before the monitor with a stay of 0 or 1 days is released in step
+# 4 (so it is counted on the admission day), as is one taken after the monitor
+# with a one day stay. As with NCCU_Model's CotAllocator, a freed cot goes to
+# the next waiting baby straight away.
+class NCCU_Batch_Model:
+    def __init__(self, sim_params_instance, number_of_runs=None, seed=None, census=None):
+        self.sim_params = SimulationParameters.from_object(sim_params_instance)
+        params = self.sim_params
+
+        self.number_of_runs = number_of_runs if number_of_runs is not None else params.number_of_runs
+        self.sim_duration = params.sim_duration
+        self.warm_up_duration = params.warm_up_duration
+        self.day_births_inter = params.day_births_inter
+        self.rng = np.random.default_rng(seed)
+
+        self.capacity = np.array([params.number_of_NICU_cots,
+                                  params.number_of_HDCU_cots,
+                                  params.number_of_SCBU_cots], dtype=np.int64)
+        stay_means = cot_stay_means(params)
+        self.stay_means = [stay_means[name] for name in UNIT_NAMES]
+
+        p_NICU, p_HDCU, p_SCBU = first_need_probabilities(params)
+        self.need_probabilities = [p_NICU, p_HDCU, p_SCBU, 1 - p_NICU - p_HDCU - p_SCBU]
+
+        # Which queues each unit serves, in the priority order of its requests
+        self.unit_queues = [
+            [UNIT_NAMES.index(level) for level in UNIT_NAMES if name in ELIGIBLE_UNITS[level]]
+            for name in UNIT_NAMES
+        ]
+        # Free cots are filled least intensive unit first, so a baby who could
+        # take either gets a cot at their own level before stepping up
+        self.fill_order = list(reversed(range(len(UNIT_NAMES))))
+
+        runs = self.number_of_runs
+        self.release_day = [np.full((runs, cots), FREE, dtype=np.int64) for cots in self.capacity]
+        self.late_release = [np.zeros((runs, cots), dtype=bool) for cots in self.capacity]
+        self.queue = np.zeros((runs, len(UNIT_NAMES)), dtype=np.int64)
+        if census is not None:
+            # Each run carries on from one snapshot of the steady-state census
+            snapshots = self.rng.integers(len(census), size=runs)
+            self.release_day = [stays[snapshots] for stays in census.remaining_stays]
+            self.late_release = [late[snapshots] for late in census.late_release]
+            self.queue = census.queue[snapshots]
+
+        self.resource_monitor_df = None
+
+    def release_cots(self, day, late):
+        for unit in range(len(UNIT_NAMES)):
+            due = (self.release_day[unit] == day) & (self.late_release[unit] == late)
+            self.release_day[unit][due] = FREE
+
+    def admit(self, unit, level, day, before_monitor):
+        # Move as many babies as possible from one queue into a unit's free cots
+        release_day = self.release_day[unit]
+        free = release_day == FREE
+        admitted = np.minimum(free.sum(axis=1), self.queue[:, level])
+        if not admitted.any():
+            return False
+
+        # The first `admitted` free cots of each run are taken
+        taken = free & (np.cumsum(free, axis=1) <= admitted[:, None])
+        stays = np.rint(self.stay_means[unit] * self.rng.standard_exponential(int(admitted.sum())))
+        stays = stays.astype(np.int64)
+
+        if before_monitor:
+            release_day[taken] = day + stays
+            self.late_release[unit][taken] = stays <= 1
+        else:
+            # A zero day stay after the monitor frees the cot again straight away
+            release_day[taken] = np.where(stays > 0, day + stays, FREE)
+            self.late_release[unit][taken] = stays == 1
+        self.queue[:, level] -= admitted
+        return True
+
+    def admit_waiting(self, day, before_monitor):
+        admitted_any = True
+        while admitted_any:
+            admitted_any = False
+            for unit in self.fill_order:
+                for level in self.unit_queues[unit]:
+                    admitted_any |= self.admit(unit, level, day, before_monitor)
+
+    def generate_birth_arrivals(self):
+        # Births per day as in NCCU_Model, split by the first cot each one needs
+        births = np.rint(self.day_births_inter * self.rng.standard_exponential(self.number_of_runs))
+        needs = self.rng.multinomial(births.astype(np.int64), self.need_probabilities)
+        self.queue += needs[:, :len(UNIT_NAMES)]
+
+    def run(self):
+        runs = self.number_of_runs
+        n_units = len(UNIT_NAMES)
+        record_days = [day for day in range(1, self.sim_duration) if day > self.warm_up_duration]
+        daily_use = np.zeros((runs, len(record_days), n_units), dtype=np.int64)
+        queue_length = np.zeros((runs, len(record_days), n_units), dtype=np.int64)
+        record_index = {day: i for i, day in enumerate(record_days)}
+
+        for day in range(self.sim_duration):
+            self.release_cots(day, late=False)
+            self.admit_waiting(day, before_monitor=True)
+
+            self.generate_birth_arrivals()
+            self.admit_waiting(day, before_monitor=True)
+
+            if day in record_index:
+                i = record_index[day]
+                for unit in range(n_units):
+                    daily_use[:, i, unit] = (self.release_day[unit] != FREE).sum(axis=1)
+                    # A waiting baby counts in the queue of every unit they requested
+                    queue_length[:, i, unit] = self.queue[:, self.unit_queues[unit]].sum(axis=1)
+
+            self.release_cots(day, late=True)
+            self.admit_waiting(day, before_monitor=False)
+
+        n_days = len(record_days)
+        self.resource_monitor_df = monitor_frame(
+            np.repeat(np.arange(1, runs + 1), n_days * n_units),
+            np.tile(np.repeat(np.array(record_days, dtype=np.int64), n_units), runs),
+            np.tile(np.arange(n_units), runs * n_days),
+            UNIT_NAMES,
+            daily_use.reshape(-1),
+            np.tile(self.capacity, runs * n_days),
+            queue_length.reshape(-1),
+        )
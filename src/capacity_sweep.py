@@ -0,0 +1,156 @@
+import hashlib
+import itertools
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from src.replication import run_replications, pool_context, ReplicationError
+from src.simulation import Simulate
+from src.unit_parameters import UNIT_NAMES
+
+logger = logging.getLogger(__name__)
+
+# Parameters a sweep can vary, in the order its results table lists them
+SWEEP_PARAMETERS = ("number_of_NICU_cots", "number_of_HDCU_cots", "number_of_SCBU_cots", "annual_birth_rate")
+
+# KPIs stored per cell for each unit, read from the cell's ReplicationSummary
+SWEEP_KPIS = ("Utilization_Rate", "Queue_Length", "P_Full")
+
+
+def sweep_cells(grid):
+    # Every combination of the grid's values, e.g.
+    # {"number_of_NICU_cots": [2, 3], "annual_birth_rate": [3000, 4000]}
+    unknown = set(grid) - set(SWEEP_PARAMETERS)
+    if unknown:
+        raise ValueError(f"Cannot sweep over {sorted(unknown)}")
+    names = [name for name in SWEEP_PARAMETERS if name in grid]
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def sweep_key(sim_params, number_of_runs, engine, random_state):
+    # Identifies everything a cell's KPIs depend on besides the swept values,
+    # so a resumed sweep only reuses cells computed with the same settings
+    values = sim_params.as_dict()
+    for name in SWEEP_PARAMETERS + ("day_births_inter", "number_of_runs"):
+        values.pop(name)
+    settings = sorted(values.items()) + [("runs", number_of_runs), ("engine", engine), ("seed", random_state)]
+    return hashlib.sha1(repr(settings).encode()).hexdigest()[:16]
+
+
+def run_sweep_cell(sim_params, cell, number_of_runs, engine="simpy", random_state=None):
+    # Runs one cell's replications in this process and returns its row of KPIs
+    changes = dict(cell)
+    if "annual_birth_rate" in changes:
+        changes["day_births_inter"] = round(changes["annual_birth_rate"] / 365, 2)
+    cell_params = sim_params.replace(**changes, number_of_runs=number_of_runs)
+    summary = run_replications(cell_params, number_of_runs, engine=engine, aggregate=True,
+                               random_state=random_state)
+
+    row = {name: getattr(cell_params, name) for name in SWEEP_PARAMETERS}
+    for unit in UNIT_NAMES:
+        unit_summary = summary[summary["Resource"] == unit]
+        for kpi in SWEEP_KPIS:
+            row[f"{unit}_{kpi}"] = unit_summary[kpi].mean()
+    row["Runs"] = number_of_runs
+    return row
+
+
+def load_sweep_results(results_path):
+    if results_path and os.path.exists(results_path):
+        return pd.read_parquet(results_path)
+    return pd.DataFrame()
+
+
+def save_sweep_results(results, results_path):
+    # Written to a temporary file first so an interrupted save never leaves a
+    # half written table behind
+    results_dir = os.path.dirname(results_path)
+    if results_dir:
+        os.makedirs(results_dir, exist_ok=True)
+    temporary_path = f"{results_path}.tmp"
+    results.to_parquet(temporary_path, index=False)
+    os.replace(temporary_path, results_path)
+
+
+def run_capacity_sweep(sim_params, grid, number_of_runs, results_path, workers=1, engine="simpy",
+                       random_state=None, progress_callback=None, cancel_token=None, partial_callback=None):
+    """Run number_of_runs replications for every cell of grid and return the KPI table.
+
+    Each cell is one task for the process pool, running its replications
+    serially, and every cell uses the same random_state so cells are compared
+    on common random numbers. A cell's row is saved to results_path as soon as
+    it finishes, so an interrupted sweep resumes where it stopped: cells already
+    in the table with the same settings are skipped. progress_callback(done, total)
+    is called as cells finish, and partial_callback(results) with this sweep's
+    rows so far. Once cancel_token is cancelled no more cells are started, and
+    the cells already finished are returned.
+    """
+    snapshot = Simulate(sim_params)
+    key = sweep_key(snapshot, number_of_runs, engine, random_state)
+
+    results = load_sweep_results(results_path)
+    done = set()
+    if not results.empty:
+        matching = results[results["Sweep_Key"] == key]
+        done = {tuple(row) for row in matching[list(SWEEP_PARAMETERS)].itertuples(index=False)}
+
+    cells = sweep_cells(grid)
+    todo = []
+    for cell in cells:
+        values = tuple(cell.get(name, getattr(snapshot, name)) for name in SWEEP_PARAMETERS)
+        if values not in done:
+            todo.append(cell)
+    if len(todo) < len(cells):
+        logger.info(f"Resuming sweep, {len(cells) - len(todo)} of {len(cells)} cells already computed")
+
+    completed = len(cells) - len(todo)
+    if progress_callback is not None:
+        progress_callback(completed, len(cells))
+
+    def save_row(row):
+        nonlocal results, completed
+        row["Sweep_Key"] = key
+        results = pd.concat([results, pd.DataFrame([row])], ignore_index=True)
+        save_sweep_results(results, results_path)
+        completed += 1
+        if progress_callback is not None:
+            progress_callback(completed, len(cells))
+        if partial_callback is not None:
+            partial_callback(results[results["Sweep_Key"] == key])
+
+    def cancelled():
+        return cancel_token is not None and cancel_token.cancelled
+
+    # A cell with a failed run is left out of the table, so a resumed sweep
+    # tries it again; errors of the pool itself stop the sweep
+    if workers is None or workers <= 1:
+        for cell in todo:
+            if cancelled():
+                break
+            try:
+                save_row(run_sweep_cell(snapshot, cell, number_of_runs, engine, random_state))
+            except ReplicationError as e:
+                logger.error(f"Error in sweep cell {cell}: {e}")
+    else:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=pool_context()) as executor:
+            futures = {executor.submit(run_sweep_cell, snapshot, cell, number_of_runs, engine, random_state): cell
+                       for cell in todo}
+            for future in as_completed(futures):
+                if cancelled():
+                    # Cells already underway finish, the rest never start
+                    for pending_future in futures:
+                        pending_future.cancel()
+                    break
+                try:
+                    save_row(future.result())
+                except ReplicationError as e:
+                    logger.error(f"Error in sweep cell {futures[future]}: {e}")
+
+    if cancelled():
+        logger.info(f"Sweep stopped after {completed} of {len(cells)} cells")
+    if results.empty:
+        return results
+    results = results[results["Sweep_Key"] == key]
+    return results.sort_values(list(SWEEP_PARAMETERS)).reset_index(drop=True)
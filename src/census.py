@@ -0,0 +1,82 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from src.batch_engine import NCCU_Batch_Model, FREE
+from src.simulation import Simulate
+from src.unit_parameters import UNIT_NAMES
+
+logger = logging.getLogger(__name__)
+
+CENSUS_REPORT_COLUMNS = ["Resource", "Mean_Occupancy", "Mean_Queue", "Mean_Remaining_Stay", "Census_Runs", "Census_Day"]
+
+# Census pilot runs are seeded apart from the scenario's own runs and from the
+# warm-up pilot (stream 1)
+CENSUS_STREAM = 2
+
+
+# Steady-state census of a scenario: the state of the units at the end of a
+# warm-up in many pilot runs. Each snapshot is one pilot run's occupied cots,
+# with the days left of each stay, and the babies queuing at each level. A
+# replication started from the census draws one snapshot and carries on from
+# it, so it can record from day 0 instead of first filling empty units.
+class SteadyStateCensus:
+    def __init__(self, remaining_stays, late_release, queue, census_day):
+        # remaining_stays and late_release hold one (snapshots x cots) array per
+        # unit, with FREE for an empty cot; queue is (snapshots x levels)
+        self.remaining_stays = remaining_stays
+        self.late_release = late_release
+        self.queue = queue
+        self.census_day = census_day
+
+    def __len__(self):
+        return len(self.queue)
+
+    def occupants(self, index):
+        # (unit, days left, late release) of every occupied cot in one snapshot
+        return [(name, int(days_left), bool(late))
+                for name, stays, late_release in zip(UNIT_NAMES, self.remaining_stays, self.late_release)
+                for days_left, late in zip(stays[index], late_release[index]) if days_left != FREE]
+
+    def queued(self, index):
+        # (level, babies waiting) in one snapshot
+        return list(zip(UNIT_NAMES, self.queue[index].tolist()))
+
+    def report(self):
+        rows = []
+        for unit, (name, stays) in enumerate(zip(UNIT_NAMES, self.remaining_stays)):
+            occupied = stays != FREE
+            rows.append([name, occupied.sum(axis=1).mean(), self.queue[:, unit].mean(),
+                         stays[occupied].mean() if occupied.any() else np.nan, len(self), self.census_day])
+        return pd.DataFrame(rows, columns=CENSUS_REPORT_COLUMNS)
+
+
+def build_census(sim_params, census_runs=200, census_day=None, random_state=None):
+    """Steady-state census of a scenario from census_runs pilot runs.
+
+    The pilot runs use the batched engine, which steps them all together, and
+    start from empty units. Their state is taken at the end of census_day (the
+    scenario's warm_up_duration by default), when it has forgotten the empty
+    start. The census serves both engines.
+    """
+    snapshot = Simulate(sim_params)
+    if census_day is None:
+        census_day = snapshot.warm_up_duration
+    if census_day < 1:
+        raise ValueError("The census needs at least one day of pilot run to be taken from")
+    census_state = None if random_state is None else (random_state, CENSUS_STREAM)
+
+    # Run to the end of census_day, with nothing recorded
+    pilot_params = snapshot.replace(sim_duration=census_day + 1, warm_up_duration=census_day + 1)
+    pilot = NCCU_Batch_Model(pilot_params, number_of_runs=census_runs, seed=np.random.SeedSequence(census_state))
+    pilot.run()
+
+    # A run started from the census begins on the pilot's next day
+    remaining_stays = [np.where(release_day == FREE, FREE, release_day - (census_day + 1))
+                       for release_day in pilot.release_day]
+    census = SteadyStateCensus(remaining_stays, [late.copy() for late in pilot.late_release],
+                               pilot.queue.copy(), census_day)
+    logger.info(f"Built a steady-state census from {census_runs} pilot runs at day {census_day}")
+    return census
+
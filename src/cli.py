@@ -0,0 +1,178 @@
+"""Command line runner for the NCCU model, for scheduled runs and servers
+where starting the Streamlit app is not wanted.
+
+    nccu-sim run
+    nccu-sim run --runs 500 --engine batch --aggregate
+    nccu-sim run --set number_of_NICU_cots=4 --set annual_birth_rate=3500 --output data/nicu_4.parquet
+
+Settings come from parameters.yaml: the care chances and run settings, then
+any --set overrides. Results are written as Parquet with the scenario in the
+file's metadata, like the app saves them. Nothing here imports Streamlit,
+Plotly or seaborn.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+import yaml
+
+from modules.data_loader import write_data
+from modules.logger_configurator import configure_logger
+from modules.read_config import read_config
+from src.parameters import SimulationParameters
+from src.replication import run_replications, ReplicationError
+from src.result_cache import result_cache_key
+from src.scenario import run_scenario, scenario_options
+from src.profiling import EngineProfile, write_profile
+
+logger = logging.getLogger(__name__)
+
+
+def parse_overrides(assignments):
+    # name=value pairs from --set, with values read as YAML so numbers keep their type
+    overrides = {}
+    for assignment in assignments:
+        name, separator, value = assignment.partition("=")
+        if not separator or not name:
+            raise ValueError(f"Expected name=value, got {assignment!r}")
+        overrides[name.strip()] = yaml.safe_load(value)
+    return overrides
+
+
+def run_command(args):
+    config = read_config(args.config)
+    overrides = parse_overrides(args.set)
+    if args.runs is not None:
+        overrides["number_of_runs"] = args.runs
+    try:
+        sim_params = SimulationParameters.from_config(config, **overrides)
+    except TypeError as e:
+        raise ValueError(str(e))
+
+    random_state = config["info"]["random_state"] if args.seed is None else args.seed
+    pilot_runs = args.pilot_runs if args.detect_warm_up else None
+    census_runs = args.census_runs if args.census else None
+    if args.output:
+        output_path = args.output
+    elif args.aggregate:
+        output_path = config["data"]["resource_summary"]
+    else:
+        output_path = config["data"]["resource_data"]
+    if args.trace_patients is None:
+        patient_log_path = None
+    else:
+        patient_log_path = args.trace_patients or config["data"]["patient_log"]
+
+    profiling = args.profile or config.get("profiling", {}).get("enabled", False)
+    profile = EngineProfile(args.engine) if profiling else None
+
+    def report_progress(completed_runs, total_runs):
+        logger.info(f"{completed_runs} of {total_runs} runs finished")
+
+    start_time = time.time()
+    try:
+        scenario_run = run_scenario(run_replications, sim_params, sim_params.number_of_runs,
+                                    pilot_runs=pilot_runs, census_runs=census_runs, workers=args.workers,
+                                    progress_callback=report_progress if args.progress else None,
+                                    engine=args.engine,
+                                    patient_log_path=patient_log_path,
+                                    aggregate=args.aggregate, random_state=random_state, profile=profile)
+    except ReplicationError as e:
+        print(f"{e}, nothing written to {output_path}", file=sys.stderr)
+        return 1
+    duration = time.time() - start_time
+    data = scenario_run["result"]
+
+    # An incomplete experiment is an error, not a smaller result
+    if data.empty:
+        completed_runs = 0
+    elif args.aggregate:
+        completed_runs = int(data["Runs"].max())
+    else:
+        completed_runs = data["Run_Number"].nunique()
+    if completed_runs < sim_params.number_of_runs:
+        print(f"Only {completed_runs} of {sim_params.number_of_runs} runs finished, nothing written to {output_path}",
+              file=sys.stderr)
+        return 1
+
+    warm_up_report = scenario_run["warm_up_report"]
+    if warm_up_report is not None:
+        print(f"Warm up of {scenario_run['warm_up']} days from {args.pilot_runs} pilot runs")
+        print(warm_up_report.to_string(index=False))
+    census_report = scenario_run["census_report"]
+    if census_report is not None:
+        print(f"Runs started from a steady-state census of {args.census_runs} pilot runs "
+              f"at day {census_report['Census_Day'].iloc[0]}")
+        print(census_report.to_string(index=False))
+
+    # Keyed like the app's result cache, on the settings before the pilot runs
+    scenario = {
+        "scenario_key": result_cache_key(sim_params, args.engine, random_state,
+                                         number_of_runs=sim_params.number_of_runs, aggregate=args.aggregate,
+                                         **scenario_options(pilot_runs, census_runs)),
+        "simulation_parameters": scenario_run["sim_params"].as_dict(),
+        "engine": args.engine,
+        "random_state": random_state,
+        "summarised": args.aggregate,
+        "precision_targets": None,
+        "warm_up_detection": warm_up_report.to_dict("records") if warm_up_report is not None else None,
+        "census": census_report.to_dict("records") if census_report is not None else None,
+    }
+
+    write_data(data, output_path, scenario)
+    print(f"{completed_runs} runs with the {args.engine} engine in {duration:.2f} s, "
+          f"{len(data)} rows written to {output_path}")
+    if profile is not None:
+        profile_path = write_profile(profile, output_path, scenario)
+        print(profile.to_dataframe().to_string(index=False))
+        print(f"Profile written to {profile_path}")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="nccu-sim", description="Run the NCCU simulation without the web app")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="run replications and save the results as Parquet")
+    run.add_argument("--config", default="parameters.yaml", help="settings file (default: parameters.yaml)")
+    run.add_argument("--set", action="append", default=[], metavar="NAME=VALUE",
+                     help="override a simulation parameter or run setting, may be repeated")
+    run.add_argument("--runs", type=int, help="number of replications (default: run_settings.number_of_runs)")
+    run.add_argument("--engine", choices=("simpy", "batch"), default="simpy", help="simulation engine (default: simpy)")
+    run.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                     help="worker processes, 1 runs everything in this process (default: one per CPU)")
+    run.add_argument("--seed", type=int, help="random state (default: info.random_state)")
+    run.add_argument("--aggregate", action="store_true",
+                     help="save the per-day summary across runs instead of every run's rows")
+    run.add_argument("--output", help="Parquet file to write (default: data.resource_data, "
+                                      "or data.resource_summary with --aggregate)")
+    run.add_argument("--trace-patients", nargs="?", const="", default=None, metavar="PATH",
+                     help="also log every patient journey, to PATH or data.patient_log (simpy engine only)")
+    run.add_argument("--detect-warm-up", action="store_true",
+                     help="set the warm up from pilot runs by MSER-5, keeping the number of recorded days")
+    run.add_argument("--pilot-runs", type=int, default=10, help="pilot runs for --detect-warm-up (default: 10)")
+    run.add_argument("--census", action="store_true",
+                     help="start every run from a steady-state census taken after the warm up, and record from day 0")
+    run.add_argument("--census-runs", type=int, default=200, help="pilot runs for --census (default: 200)")
+    run.add_argument("--profile", action="store_true",
+                     help="count and time the engine's hot paths and save the report next to the results "
+                          "(default: profiling.enabled)")
+    run.add_argument("--progress", action="store_true", help="log progress as runs finish")
+    run.set_defaults(handler=run_command)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    configure_logger(args.config)
+    try:
+        return args.handler(args)
+    except ValueError as e:
+        parser.error(str(e))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+from collections import deque
+
+from src.unit_parameters import UNIT_NAMES, ELIGIBLE_UNITS
+
+
+# State of one unit's cots, read by the daily monitor
+class CotUnit:
+    __slots__ = ("name", "capacity", "count", "queue_length")
+
+    def __init__(self, name, capacity):
+        self.name = name
+        self.capacity = capacity
+        self.count = 0
+        # Babies waiting who could be given a cot in this unit
+        self.queue_length = 0
+
+
+# Allocates cots across the NICU -> HDCU -> SCBU hierarchy with one request per
+# baby. A request is granted the first free cot in ELIGIBLE_UNITS order for the
+# baby's level of care, or waits in a FIFO queue for that level. A released cot
+# goes straight to the longest waiting baby of the most intensive level the unit
+# serves, so nothing has to be cancelled and an admission costs the same however
+# long the queues are.
+class CotAllocator:
+    def __init__(self, env, capacities):
+        self.env = env
+        self.units = {name: CotUnit(name, capacities[name]) for name in UNIT_NAMES}
+        self.waiting = {level: deque() for level in UNIT_NAMES}
+
+        self.eligible_units = {level: [self.units[name] for name in ELIGIBLE_UNITS[level]]
+                               for level in UNIT_NAMES}
+        # Levels each unit serves, most intensive first, which is the priority
+        # order the separate unit queues used to give
+        self.served_levels = {name: [level for level in UNIT_NAMES if name in ELIGIBLE_UNITS[level]]
+                              for name in UNIT_NAMES}
+
+    def request(self, level):
+        # Returns an event whose value is the name of the unit the cot is in
+        event = self.env.event()
+        for unit in self.eligible_units[level]:
+            if unit.count < unit.capacity:
+                unit.count += 1
+                return event.succeed(unit.name)
+
+        self.waiting[level].append(event)
+        for unit in self.eligible_units[level]:
+            unit.queue_length += 1
+        return event
+
+    def release(self, unit_name):
+        for level in self.served_levels[unit_name]:
+            queue = self.waiting[level]
+            if queue:
+                # The cot changes hands without ever being free
+                for unit in self.eligible_units[level]:
+                    unit.queue_length -= 1
+                queue.popleft().succeed(unit_name)
+                return
+        self.units[unit_name].count -= 1
@@ -0,0 +1,114 @@
+PARAMETER_NAMES = (
+    "chance_need_NICU",
+    "chance_need_HDCU",
+    "chance_need_SCBU",
+    "chance_need_HDCU_after_NICU",
+    "chance_need_SCBU_after_NICU",
+    "chance_need_NICU_after_HDCU",
+    "chance_need_SCBU_after_HDCU",
+    "chance_need_NICU_after_SCBU",
+    "chance_need_HDCU_after_SCBU",
+    "number_of_runs",
+    "sim_duration",
+    "warm_up_duration",
+    "number_of_NICU_cots",
+    "number_of_HDCU_cots",
+    "number_of_SCBU_cots",
+    "annual_birth_rate",
+    "day_births_inter",
+    "avg_NICU_stay",
+    "avg_HDCU_stay",
+    "avg_SCBU_stay",
+)
+
+
+# Immutable set of values a model run is configured with. Each NCCU_Model holds
+# its own instance, so differently configured models can share one process.
+class SimulationParameters:
+    __slots__ = PARAMETER_NAMES
+
+    def __init__(self, **values):
+        missing = [name for name in PARAMETER_NAMES if name not in values]
+        if missing:
+            raise TypeError(f"Missing simulation parameters: {', '.join(missing)}")
+        unknown = [name for name in values if name not in PARAMETER_NAMES]
+        if unknown:
+            raise TypeError(f"Unknown simulation parameters: {', '.join(unknown)}")
+
+        for name in PARAMETER_NAMES:
+            object.__setattr__(self, name, values[name])
+
+    @classmethod
+    def from_object(cls, sim_params):
+        # Freeze any object carrying the parameters as attributes, e.g. the
+        # simulation_parameters instance the Streamlit sidebar fills in
+        if isinstance(sim_params, cls):
+            return sim_params
+        return cls(**{name: getattr(sim_params, name, None) for name in PARAMETER_NAMES})
+
+    @classmethod
+    def from_config(cls, config, **overrides):
+        # Build from parameters.yaml: the care chances, then the run settings,
+        # then any overrides. The daily birth rate follows the annual one unless
+        # it is overridden itself, as the sidebar computes it.
+        values = dict(config['simulation_parameters'])
+        values.update(config.get('run_settings') or {})
+        values.update(overrides)
+        if 'day_births_inter' not in overrides:
+            values['day_births_inter'] = round(values['annual_birth_rate'] / 365, 2)
+        return cls(**values)
+
+    def replace(self, **changes):
+        # Return a copy with some values changed, the original is left untouched
+        values = self.as_dict()
+        values.update(changes)
+        return self.__class__(**values)
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in PARAMETER_NAMES}
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{self.__class__.__name__} is immutable, use replace() instead")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{self.__class__.__name__} is immutable")
+
+    def __reduce__(self):
+        # Slots plus a blocked __setattr__ need an explicit recipe to pickle to workers
+        return (_restore_parameters, (self.as_dict(),))
+
+    def __eq__(self, other):
+        if not isinstance(other, SimulationParameters):
+            return NotImplemented
+        return self.as_dict() == other.as_dict()
+
+    def __hash__(self):
+        return hash(tuple(getattr(self, name) for name in PARAMETER_NAMES))
+
+    def __repr__(self):
+        values = ", ".join(f"{name}={getattr(self, name)!r}" for name in PARAMETER_NAMES)
+        return f"{self.__class__.__name__}({values})"
+
+
+def _restore_parameters(values):
+    return SimulationParameters(**values)
+
+
+def first_need_probabilities(params):
+    # Chance a birth's first cot is NICU, HDCU or SCBU. NICU is checked first,
+    # then HDCU, then SCBU, and the first need found decides the cot requested.
+    p_NICU = params.chance_need_NICU
+    p_HDCU = (1 - p_NICU) * params.chance_need_HDCU
+    p_SCBU = (1 - p_NICU) * (1 - params.chance_need_HDCU) * params.chance_need_SCBU
+    return p_NICU, p_HDCU, p_SCBU
+
+
+def cot_stay_means(params):
+    # Mean stay for a patient placed in each type of cot. This follows
+    # NCCU_Model.manage_birth_resource, where HDCU cots use avg_HDCU_stay and
+    # every other cot, SCBU included, uses avg_NICU_stay.
+    return {
+        'NICU': params.avg_NICU_stay,
+        'HDCU': params.avg_HDCU_stay,
+        'SCBU': params.avg_NICU_stay,
+    }
@@ -0,0 +1,67 @@
+import os
+from array import array
+
+import numpy as np
+import pandas as pd
+
+from src.unit_parameters import UNIT_NAMES
+
+# 'admission' is a cot at the baby's own level of care, 'transfer' a cot in a
+# more intensive unit because their own level was full
+EVENT_TYPES = ('admission', 'transfer', 'discharge')
+ADMISSION, TRANSFER, DISCHARGE = range(len(EVENT_TYPES))
+
+PATIENT_LOG_COLUMNS = ["Run_Number", "Day", "Pat_ID", "Event", "Level", "Unit", "Queue_Time"]
+
+
+# Patient journey log for one run. Events are appended to typed array columns,
+# which costs a few appends per event, and only become a DataFrame when the
+# run's log is flushed.
+class PatientJourneyLog:
+    def __init__(self, run_number):
+        self.run_number = run_number
+        self.unit_codes = {name: code for code, name in enumerate(UNIT_NAMES)}
+        self.day = array('q')
+        self.p_id = array('q')
+        self.event = array('b')
+        self.level = array('b')
+        self.unit = array('b')
+        self.queue_time = array('d')
+
+    def record(self, day, p_id, event, level, unit, queue_time=float('nan')):
+        self.day.append(day)
+        self.p_id.append(p_id)
+        self.event.append(event)
+        self.level.append(self.unit_codes[level])
+        self.unit.append(self.unit_codes[unit])
+        self.queue_time.append(queue_time)
+
+    def __len__(self):
+        return len(self.day)
+
+    def to_dataframe(self):
+        names = np.array(UNIT_NAMES, dtype=object)
+        return pd.DataFrame({
+            "Run_Number": np.full(len(self), self.run_number),
+            "Day": np.frombuffer(self.day, dtype=np.int64),
+            "Pat_ID": np.frombuffer(self.p_id, dtype=np.int64),
+            "Event": np.array(EVENT_TYPES, dtype=object)[np.frombuffer(self.event, dtype=np.int8)],
+            "Level": names[np.frombuffer(self.level, dtype=np.int8)],
+            "Unit": names[np.frombuffer(self.unit, dtype=np.int8)],
+            "Queue_Time": np.frombuffer(self.queue_time, dtype=np.float64),
+        }, columns=PATIENT_LOG_COLUMNS)
+
+
+def write_patient_log(journey_frames, path):
+    # Writes the journeys of every run in one go, as Parquet unless the path ends in .csv
+    data = pd.concat(journey_frames, ignore_index=True) if journey_frames \
+        else pd.DataFrame(columns=PATIENT_LOG_COLUMNS)
+
+    log_dir = os.path.dirname(path)
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+    if path.endswith(".csv"):
+        data.to_csv(path, index=False)
+    else:
+        data.to_parquet(path, index=False)
+    return data
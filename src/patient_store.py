@@ -0,0 +1,56 @@
+import numpy as np
+
+# Column name and dtype of everything held per patient
+PATIENT_COLUMNS = (
+    ("p_id", np.int64),
+    ("NICU_Pat", np.bool_),
+    ("HDCU_Pat", np.bool_),
+    ("SCBU_Pat", np.bool_),
+    ("nicu_chance", np.float64),
+    ("hdcu_chance", np.float64),
+    ("scbu_chance", np.float64),
+    ("q_time_NICU", np.float64),
+    ("q_time_HDCU", np.float64),
+    ("q_time_SCBU", np.float64),
+)
+
+# Queue time column filled in when a patient with each care flag gets a cot
+QUEUE_TIME_COLUMN = {"NICU_Pat": "q_time_NICU", "HDCU_Pat": "q_time_HDCU", "SCBU_Pat": "q_time_SCBU"}
+
+
+# Births held as preallocated NumPy columns rather than one object each.
+# A patient is the row index returned by add(), so the cost per birth is a few
+# array writes whatever the length of the run.
+class PatientStore:
+    def __init__(self, expected_patients=1024):
+        capacity = max(int(expected_patients), 16)
+        for name, dtype in PATIENT_COLUMNS:
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+        self.capacity = capacity
+        self.size = 0
+
+    def _grow(self):
+        self.capacity *= 2
+        for name, dtype in PATIENT_COLUMNS:
+            values = getattr(self, name)
+            grown = np.zeros(self.capacity, dtype=dtype)
+            grown[:len(values)] = values
+            setattr(self, name, grown)
+
+    def add(self, p_id):
+        # Returns the row of a new patient with every flag cleared
+        index = self.size
+        if index == self.capacity:
+            self._grow()
+        self.p_id[index] = p_id
+        self.size = index + 1
+        return index
+
+    def determine_destiny(self, index, prob_var, var_pat, var_chance, sc):
+        # sc is a U(0, 1) draw from the model's random streams
+        if sc < prob_var:
+            getattr(self, var_pat)[index] = True
+            getattr(self, var_chance)[index] = sc
+
+    def needs_cot(self, index):
+        return self.NICU_Pat[index] or self.HDCU_Pat[index] or self.SCBU_Pat[index]
@@ -0,0 +1,151 @@
+import json
+import os
+import time
+from collections import Counter
+
+import pandas as pd
+
+PROFILE_REPORT_COLUMNS = ["Kind", "Name", "Total", "Per_Run"]
+
+
+# Counters and timers of the engines' hot paths, summed over the runs profiled.
+# Nothing in the engines checks for profiling: profile_model and
+# profile_batch_model replace methods on one model instance with counted or
+# timed versions, so a run that is not profiled pays nothing at all.
+#
+# The cot allocator hands a released cot straight to the next waiting baby and
+# never cancels a request, so there is no cancellation count; queued_requests
+# counts the requests that had to wait.
+class EngineProfile:
+    def __init__(self, engine=None):
+        self.engine = engine
+        self.runs = 0
+        self.counters = Counter()
+        self.timers = Counter()
+
+    def merge(self, other):
+        self.engine = self.engine or other.engine
+        self.runs += other.runs
+        self.counters.update(other.counters)
+        self.timers.update(other.timers)
+
+    def to_dataframe(self):
+        rows = [["counter", name, value, value / self.runs if self.runs else float("nan")]
+                for name, value in sorted(self.counters.items())]
+        rows += [["seconds", name, value, value / self.runs if self.runs else float("nan")]
+                 for name, value in sorted(self.timers.items())]
+        return pd.DataFrame(rows, columns=PROFILE_REPORT_COLUMNS)
+
+    def as_dict(self):
+        return {"engine": self.engine, "runs": self.runs,
+                "counters": dict(self.counters), "seconds": dict(self.timers)}
+
+
+def timed_call(function, profile, name):
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            profile.timers[name] += time.perf_counter() - start
+    return timed
+
+
+def timed_process(generator_function, profile, name):
+    # Times the code a SimPy process generator runs between its yields, which
+    # is all of its own work; the time spent waiting is simulated, not spent
+    def timed(*args):
+        generator = generator_function(*args)
+        value = None
+        while True:
+            start = time.perf_counter()
+            try:
+                event = generator.send(value)
+            except StopIteration as stop:
+                profile.timers[name] += time.perf_counter() - start
+                return stop.value
+            profile.timers[name] += time.perf_counter() - start
+            value = yield event
+    return timed
+
+
+def profile_model(model, profile):
+    # Instruments an NCCU_Model before model.run(). The SimPy environment's
+    # step() and process() count events and processes, the cot allocator its
+    # requests and releases, and the arrival, admission and monitoring code is timed.
+    env = model.env
+    step = env.step
+    process = env.process
+
+    def counted_step():
+        profile.counters["simpy_events"] += 1
+        step()
+
+    def counted_process(generator):
+        profile.counters["processes"] += 1
+        return process(generator)
+
+    env.step = counted_step
+    env.process = counted_process
+
+    cots = model.cots
+    request = cots.request
+    release = cots.release
+
+    def counted_request(level):
+        event = request(level)
+        profile.counters["cot_requests"] += 1
+        if not event.triggered:
+            profile.counters["queued_requests"] += 1
+        return event
+
+    def counted_release(unit_name):
+        profile.counters["cot_releases"] += 1
+        release(unit_name)
+
+    cots.request = counted_request
+    cots.release = counted_release
+
+    model.generate_birth_arrivals = timed_process(model.generate_birth_arrivals, profile, "arrivals")
+    model.generate_thinned_birth_arrivals = timed_process(model.generate_thinned_birth_arrivals, profile, "arrivals")
+    model.manage_birth_resource = timed_process(model.manage_birth_resource, profile, "admissions")
+    model.monitor = timed_call(model.monitor, profile, "monitoring")
+    model.run = timed_call(model.run, profile, "run")
+    profile.engine = "simpy"
+    profile.runs += 1
+
+
+def profile_batch_model(model, profile):
+    # Instruments an NCCU_Batch_Model before model.run(). Its days are stepped
+    # for every run at once, so the times are shared by all of them.
+    model.generate_birth_arrivals = timed_call(model.generate_birth_arrivals, profile, "arrivals")
+    model.admit_waiting = timed_call(model.admit_waiting, profile, "admissions")
+    model.release_cots = timed_call(model.release_cots, profile, "releases")
+
+    admit = model.admit
+
+    def counted_admit(*args):
+        profile.counters["admission_steps"] += 1
+        return admit(*args)
+
+    model.admit = counted_admit
+    model.run = timed_call(model.run, profile, "run")
+    profile.engine = "batch"
+    profile.runs += model.number_of_runs
+
+
+def profile_report_path(results_path):
+    # Where the profile of a results file is kept, next to it
+    return os.path.splitext(results_path)[0] + "_profile.json"
+
+
+def write_profile(profile, results_path, scenario=None):
+    path = profile_report_path(results_path)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    report = profile.as_dict()
+    report["scenario"] = scenario
+    with open(path, "w") as file:
+        json.dump(report, file, indent=2, default=str)
+    return path
@@ -0,0 +1,77 @@
+import numpy as np
+
+
+def replication_seed(entropy, run_number):
+    # Seed of replication run_number (from 1) of the experiment seeded with
+    # entropy, the same as SeedSequence(entropy).spawn(run_number)[-1]. It only
+    # depends on the two numbers, so a run gets the same streams serially, in a
+    # worker process or on its own.
+    return np.random.SeedSequence(entropy, spawn_key=(run_number - 1,))
+
+
+# One replication's random numbers. Each kind of draw has its own NumPy
+# generator, filled in blocks and handed out one value at a time. Values come
+# out in exactly the order scalar draws from the same generator would give
+# them, so the block size never changes the results for a given seed.
+class RandomStreams:
+    def __init__(self, seed=None, block_size=4096):
+        if not isinstance(seed, np.random.SeedSequence):
+            seed = np.random.SeedSequence(seed)
+        self.seed_sequence = seed
+        self.block_size = block_size
+
+        # Adding a stream at the end leaves the earlier ones as they were
+        uniform_seed, births_seed, stays_seed, needs_seed, census_seed = seed.spawn(5)
+        self._uniform_rng = np.random.Generator(np.random.PCG64(uniform_seed))
+        self._births_rng = np.random.Generator(np.random.PCG64(births_seed))
+        self._stays_rng = np.random.Generator(np.random.PCG64(stays_seed))
+        self._needs_rng = np.random.Generator(np.random.PCG64(needs_seed))
+        self._census_rng = np.random.Generator(np.random.PCG64(census_seed))
+
+        # Buffers are plain lists, indexing them is much cheaper than NumPy scalars
+        self._uniforms, self._uniform_pos = [], 0
+        self._births, self._births_pos = [], 0
+        self._stays, self._stays_pos = [], 0
+
+    def uniform(self):
+        # U(0, 1), used for every destiny decision
+        if self._uniform_pos == len(self._uniforms):
+            self._uniforms = self._uniform_rng.random(self.block_size).tolist()
+            self._uniform_pos = 0
+        value = self._uniforms[self._uniform_pos]
+        self._uniform_pos += 1
+        return value
+
+    def daily_births(self, mean_births):
+        # Number of births on one day, an exponential draw rounded to whole births
+        if self._births_pos == len(self._births):
+            self._births = self._births_rng.standard_exponential(self.block_size).tolist()
+            self._births_pos = 0
+        value = self._births[self._births_pos]
+        self._births_pos += 1
+        return int(round(mean_births * value, 0))
+
+    def stay_length(self, mean_stay):
+        # Days spent in a cot, an exponential draw rounded to whole days
+        if self._stays_pos == len(self._stays):
+            self._stays = self._stays_rng.standard_exponential(self.block_size).tolist()
+            self._stays_pos = 0
+        value = self._stays[self._stays_pos]
+        self._stays_pos += 1
+        return int(round(mean_stay * value, 0))
+
+    def daily_needs(self, births, need_probabilities):
+        # Thins one day's births down to those needing a cot. Returns the index
+        # into need_probabilities of each baby's first need, in random arrival
+        # order; babies needing no cot are never materialised.
+        if births == 0:
+            return []
+        counts = self._needs_rng.multinomial(births, need_probabilities)
+        needs = np.repeat(np.arange(len(need_probabilities) - 1), counts[:-1])
+        if len(needs) > 1:
+            self._needs_rng.shuffle(needs)
+        return needs.tolist()
+
+    def census_snapshot(self, n_snapshots):
+        # Index of the steady-state census snapshot a run starts from
+        return int(self._census_rng.integers(n_snapshots))
@@ -0,0 +1,228 @@
+import math
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from src.simulation import NCCU_Model, Simulate
+from src.random_streams import RandomStreams, replication_seed
+from src.batch_engine import NCCU_Batch_Model
+from src.patient_log import write_patient_log
+from src.replication_summary import ReplicationSummary
+from src.profiling import EngineProfile, profile_model, profile_batch_model
+
+logger = logging.getLogger(__name__)
+
+
+# Raised by run_replications once every run is done when some of them failed,
+# so an incomplete experiment is never taken for a complete one. The runs
+# that did finish are kept in data. It is raised in sweep workers too, so its
+# args are its constructor's for it to pickle back to the main process.
+class ReplicationError(RuntimeError):
+    def __init__(self, failed_runs, data):
+        super().__init__(failed_runs, data)
+        self.failed_runs = failed_runs
+        self.data = data
+
+    def __str__(self):
+        return f"{len(self.failed_runs)} simulation run(s) failed: {self.failed_runs}"
+
+
+def pool_context():
+    # Workers start from a fresh process rather than a fork of this one, which
+    # may be the multi-threaded Streamlit server. A forked child can deadlock on
+    # a lock another thread held at the fork, such as a logging handler's.
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+
+def default_chunk_size(number_of_runs, workers):
+    # A few tasks per worker keeps the pool balanced while sharing the IPC cost
+    return max(1, math.ceil(number_of_runs / (workers * 4)))
+
+
+def run_replication_chunk(sim_params, run_numbers, entropy, trace_patients=False, aggregate=False, census=None,
+                          profile=False):
+    # Runs a group of replications in the current process, each on the streams
+    # replication_seed gives it. Returns the runs' monitor frames, or with
+    # aggregate set a ReplicationSummary of them, their patient journey
+    # frames, which are empty unless tracing, with profile set an
+    # EngineProfile of the runs, otherwise None, and the numbers of the runs
+    # that raised. A run that raises is logged and skipped, anything else is
+    # left to the caller.
+    summary = ReplicationSummary() if aggregate else None
+    chunk_profile = EngineProfile() if profile else None
+    frames, journeys, failed_runs = [], [], []
+    for run_number in run_numbers:
+        try:
+            streams = RandomStreams(replication_seed(entropy, run_number))
+            NCCU_model_instance = NCCU_Model(sim_params, run_number=run_number, streams=streams,
+                                             trace_patients=trace_patients, census=census)
+            if profile:
+                profile_model(NCCU_model_instance, chunk_profile)
+            NCCU_model_instance.run()
+            if aggregate:
+                summary.add_frame(NCCU_model_instance.resource_monitor_df)
+            else:
+                frames.append(NCCU_model_instance.resource_monitor_df)
+            if trace_patients:
+                journeys.append(NCCU_model_instance.patient_log.to_dataframe())
+        except Exception as e:
+            logger.error(f"Error in simulation run {run_number}: {e}")
+            failed_runs.append(run_number)
+    return (summary if aggregate else frames), journeys, chunk_profile, failed_runs
+
+
+def run_replications(sim_params, number_of_runs, workers=1, chunk_size=None, progress_callback=None,
+                     engine="simpy", patient_log_path=None, aggregate=False, random_state=None,
+                     first_run=1, cancel_token=None, partial_callback=None, census=None, profile=None):
+    """Run number_of_runs replications and return the merged resource_monitor_df.
+
+    workers=1 runs everything in this process, which is the fallback to use when
+    debugging. Otherwise the runs are grouped into chunks of chunk_size and spread
+    over a ProcessPoolExecutor. progress_callback(completed_runs, number_of_runs)
+    is called as runs finish. engine="batch" runs every replication at once with
+    NCCU_Batch_Model instead of one NCCU_Model per run. With patient_log_path set,
+    every patient's journey is traced and written there once all runs are done.
+    With aggregate set each run is folded into a ReplicationSummary as it
+    finishes and the per-day, per-resource summary frame is returned instead.
+
+    random_state seeds the whole experiment. Replication k always runs on the
+    k-th stream spawned from it, so its output does not depend on the workers or
+    chunking. With no random_state fresh entropy is drawn and logged, so an
+    unseeded experiment can still be replayed. The batch engine draws every
+    replication from one stream, so it is reproducible as a whole.
+
+    first_run numbers the runs from there on, so more runs of an experiment
+    can be added later with the same random_state.
+
+    With a census (a SteadyStateCensus from src.census) every run starts from
+    one of its snapshots instead of empty units.
+
+    profile is an EngineProfile from src.profiling to add the counters and
+    timers of these runs to, or None to run them unprofiled.
+
+    If any run raised, a ReplicationError listing the failed runs is raised
+    once the others are done. Errors of the process pool itself, such as a
+    worker that died, are not caught.
+
+    Once cancel_token (a CancellationToken) is cancelled no more runs are
+    started and the runs finished so far are returned. Unless chunk_size is
+    given, each pool task is then a single run, so stopping waits for at most
+    one run per worker. partial_callback(summary) is called with a
+    ReplicationSummary of every run collected so far each time more are; it
+    is updated in place afterwards, so read it before returning.
+    """
+    # Frozen, picklable copy of the parameters that every run and worker shares
+    snapshot = Simulate(sim_params)
+    entropy = np.random.SeedSequence(random_state).entropy
+    if random_state is None:
+        logger.info(f"Unseeded simulation, replay it with random_state={entropy}")
+
+    trace_patients = patient_log_path is not None
+
+    if engine == "batch":
+        if trace_patients:
+            raise ValueError("Patient journeys can only be traced with the simpy engine")
+        if cancel_token is not None and cancel_token.cancelled:
+            return ReplicationSummary().to_dataframe() if aggregate else pd.DataFrame()
+        # The batch starting at run k draws from run k's seed
+        batch_model = NCCU_Batch_Model(snapshot, number_of_runs=number_of_runs,
+                                       seed=replication_seed(entropy, first_run), census=census)
+        if profile is not None:
+            profile_batch_model(batch_model, profile)
+        batch_model.run()
+        batch_df = batch_model.resource_monitor_df
+        batch_df["Run_Number"] += first_run - 1
+        if progress_callback is not None:
+            progress_callback(number_of_runs, number_of_runs)
+        if aggregate or partial_callback is not None:
+            summary = ReplicationSummary()
+            summary.add_frame(batch_df)
+            if partial_callback is not None:
+                partial_callback(summary)
+            if aggregate:
+                return summary.to_dataframe()
+        return batch_df
+    if engine != "simpy":
+        raise ValueError(f"Unknown simulation engine: {engine}")
+    run_numbers = list(range(first_run, first_run + number_of_runs))
+
+    serial = workers is None or workers <= 1
+    if serial:
+        chunk_size = 1
+    elif chunk_size is None:
+        chunk_size = 1 if cancel_token is not None else default_chunk_size(number_of_runs, workers)
+    chunks = [run_numbers[i:i + chunk_size] for i in range(0, number_of_runs, chunk_size)]
+
+    # Also kept for partial results when the full frames are returned
+    summary = ReplicationSummary() if aggregate or partial_callback is not None else None
+    frames, journeys, failed_runs = [], [], []
+    # Chunks are collected in run order whatever order they finish in, holding
+    # back any that finish early until the ones before them are in
+    pending = {}
+    next_index = 0
+    completed_runs = 0
+
+    def collect(index, result):
+        nonlocal next_index, completed_runs
+        pending[index] = result
+        while next_index in pending:
+            chunk_result, chunk_journeys, chunk_profile, chunk_failed_runs = pending.pop(next_index)
+            if aggregate:
+                summary.merge(chunk_result)
+            else:
+                frames.extend(chunk_result)
+                if summary is not None:
+                    for frame in chunk_result:
+                        summary.add_frame(frame)
+            journeys.extend(chunk_journeys)
+            failed_runs.extend(chunk_failed_runs)
+            if chunk_profile is not None:
+                profile.merge(chunk_profile)
+            next_index += 1
+            if partial_callback is not None:
+                partial_callback(summary)
+        completed_runs += len(chunks[index])
+        if progress_callback is not None:
+            progress_callback(completed_runs, number_of_runs)
+
+    def cancelled():
+        return cancel_token is not None and cancel_token.cancelled
+
+    if serial:
+        for index, chunk in enumerate(chunks):
+            if cancelled():
+                break
+            collect(index, run_replication_chunk(snapshot, chunk, entropy, trace_patients, aggregate, census,
+                                                 profile is not None))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=pool_context()) as executor:
+            futures = {executor.submit(run_replication_chunk, snapshot, chunk, entropy, trace_patients,
+                                       aggregate, census, profile is not None): index
+                       for index, chunk in enumerate(chunks)}
+            for future in as_completed(futures):
+                if cancelled():
+                    # Runs already underway finish, the rest never start
+                    for pending_future in futures:
+                        pending_future.cancel()
+                    break
+                collect(futures[future], future.result())
+
+    if cancelled():
+        collected_runs = sum(len(chunk) for chunk in chunks[:next_index])
+        logger.info(f"Simulation stopped after {collected_runs} of {number_of_runs} runs")
+
+    if trace_patients:
+        write_patient_log(journeys, patient_log_path)
+
+    if aggregate:
+        data = summary.to_dataframe()
+    else:
+        data = pd.concat(frames) if frames else pd.DataFrame()
+    if failed_runs:
+        raise ReplicationError(failed_runs, data)
+    return data
@@ -0,0 +1,176 @@
+import numpy as np
+import pandas as pd
+
+from src.unit_parameters import UNIT_NAMES
+
+# Resource monitor columns summarised across runs. Utilization_Rate is derived
+# from Daily_Use / Total_Capacity in double precision rather than read from the
+# frame, where it is float32.
+SUMMARY_COLUMNS = ("Daily_Use", "Total_Capacity", "Available_Capacity", "Queue_Length", "Utilization_Rate")
+
+# Integer columns also kept as a histogram over runs per day and resource, with
+# the value its last bin is capped at. Occupancy never exceeds the unit's
+# capacity, so it needs no cap; a queue longer than the cap counts in its last bin.
+QUEUE_HISTOGRAM_CAP = 100
+HISTOGRAM_CAPS = {"Daily_Use": None, "Queue_Length": QUEUE_HISTOGRAM_CAP}
+
+# Quantiles reported from the histograms, e.g. Daily_Use_P05, for fan charts
+FAN_QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+
+# Running per-day, per-resource statistics of the resource monitor across
+# replications. Each run's frame is folded in as it finishes and can then be
+# dropped, so memory is O(days x resources) however many runs there are.
+# Means and variances are updated with Welford's method, generalised to
+# merging whole groups of runs (Chan et al.) so partial summaries from worker
+# processes combine into the same statistics. Occupancy and queue length are
+# also counted into integer histograms, which give exact percentiles and the
+# probability a unit is full on each day.
+class ReplicationSummary:
+    def __init__(self, resource_names=UNIT_NAMES):
+        self.resource_names = list(resource_names)
+        self.resource_codes = {name: code for code, name in enumerate(self.resource_names)}
+        self.n_days = 0
+        self.count = np.zeros((0, len(self.resource_names)), dtype=np.int64)
+        self.mean = {column: np.zeros(self.count.shape) for column in SUMMARY_COLUMNS}
+        self.m2 = {column: np.zeros(self.count.shape) for column in SUMMARY_COLUMNS}
+        self.minimum = {column: np.full(self.count.shape, np.inf) for column in SUMMARY_COLUMNS}
+        self.maximum = {column: np.full(self.count.shape, -np.inf) for column in SUMMARY_COLUMNS}
+        self.histogram = {column: np.zeros(self.count.shape + (1,), dtype=np.int64) for column in HISTOGRAM_CAPS}
+
+    def _ensure_days(self, n_days):
+        # Grows every accumulator to hold days 0 .. n_days - 1
+        if n_days <= self.n_days:
+            return
+        extra = n_days - self.n_days
+        n_resources = len(self.resource_names)
+
+        def grown(values, fill):
+            return np.concatenate([values, np.full((extra, n_resources), fill, dtype=values.dtype)])
+
+        self.count = grown(self.count, 0)
+        for column in SUMMARY_COLUMNS:
+            self.mean[column] = grown(self.mean[column], 0.0)
+            self.m2[column] = grown(self.m2[column], 0.0)
+            self.minimum[column] = grown(self.minimum[column], np.inf)
+            self.maximum[column] = grown(self.maximum[column], -np.inf)
+        for column, histogram in self.histogram.items():
+            self.histogram[column] = np.concatenate(
+                [histogram, np.zeros((extra,) + histogram.shape[1:], dtype=np.int64)])
+        self.n_days = n_days
+
+    def _ensure_bins(self, column, n_bins):
+        histogram = self.histogram[column]
+        if n_bins > histogram.shape[2]:
+            extra = np.zeros(histogram.shape[:2] + (n_bins - histogram.shape[2],), dtype=np.int64)
+            self.histogram[column] = np.concatenate([histogram, extra], axis=2)
+
+    def add_frame(self, frame):
+        # Folds in a resource monitor frame holding one or more runs
+        if frame.empty:
+            return
+        part = ReplicationSummary(self.resource_names)
+        n_resources = len(self.resource_names)
+
+        day = frame["Day"].to_numpy(dtype=np.int64)
+        resource = frame["Resource"].astype(object).map(self.resource_codes).to_numpy(dtype=np.int64)
+        part._ensure_days(int(day.max()) + 1)
+        cell = day * n_resources + resource
+        size = part.n_days * n_resources
+
+        counts = np.bincount(cell, minlength=size)
+        seen = counts > 0
+        part.count = counts.reshape(part.n_days, n_resources)
+        for column in SUMMARY_COLUMNS:
+            if column == "Utilization_Rate":
+                values = frame["Daily_Use"].to_numpy(dtype=np.float64) / frame["Total_Capacity"].to_numpy()
+            else:
+                values = frame[column].to_numpy(dtype=np.float64)
+            mean = np.zeros(size)
+            mean[seen] = np.bincount(cell, weights=values, minlength=size)[seen] / counts[seen]
+            m2 = np.bincount(cell, weights=(values - mean[cell]) ** 2, minlength=size)
+            minimum = np.full(size, np.inf)
+            maximum = np.full(size, -np.inf)
+            np.minimum.at(minimum, cell, values)
+            np.maximum.at(maximum, cell, values)
+
+            part.mean[column] = mean.reshape(part.count.shape)
+            part.m2[column] = m2.reshape(part.count.shape)
+            part.minimum[column] = minimum.reshape(part.count.shape)
+            part.maximum[column] = maximum.reshape(part.count.shape)
+
+        for column, cap in HISTOGRAM_CAPS.items():
+            values = frame[column].to_numpy(dtype=np.int64)
+            if cap is not None:
+                values = np.minimum(values, cap)
+            n_bins = int(values.max()) + 1
+            histogram = np.bincount(cell * n_bins + values, minlength=size * n_bins)
+            part.histogram[column] = histogram.reshape(part.count.shape + (n_bins,))
+        self.merge(part)
+
+    def merge(self, other):
+        # Combines another summary into this one. A single run merged into n
+        # runs is exactly Welford's update.
+        self._ensure_days(other.n_days)
+        other._ensure_days(self.n_days)
+
+        n_a, n_b = self.count, other.count
+        n = n_a + n_b
+        weight = np.divide(n_b, n, out=np.zeros(n.shape), where=n > 0)
+        for column in SUMMARY_COLUMNS:
+            delta = other.mean[column] - self.mean[column]
+            self.mean[column] = self.mean[column] + delta * weight
+            self.m2[column] = self.m2[column] + other.m2[column] + delta ** 2 * n_a * weight
+            self.minimum[column] = np.minimum(self.minimum[column], other.minimum[column])
+            self.maximum[column] = np.maximum(self.maximum[column], other.maximum[column])
+        for column in HISTOGRAM_CAPS:
+            n_bins = max(self.histogram[column].shape[2], other.histogram[column].shape[2])
+            self._ensure_bins(column, n_bins)
+            other._ensure_bins(column, n_bins)
+            self.histogram[column] = self.histogram[column] + other.histogram[column]
+        self.count = n
+
+    @property
+    def number_of_runs(self):
+        return int(self.count.max()) if self.count.size else 0
+
+    def quantile(self, column, q):
+        # Exact q quantile of a histogram column per day and resource: the
+        # smallest value at least a fraction q of runs are at or below. For a
+        # capped column a quantile in the last bin is only known to be >= the cap.
+        cumulative = np.cumsum(self.histogram[column], axis=2)
+        reached = cumulative >= q * self.count[:, :, None]
+        return np.argmax(reached, axis=2)
+
+    def probability_full(self):
+        # Share of runs in which each unit had every cot taken, per day
+        histogram = self.histogram["Daily_Use"]
+        capacity = self.maximum["Total_Capacity"]
+        full = np.arange(histogram.shape[2]) >= capacity[:, :, None]
+        return np.divide((histogram * full).sum(axis=2), self.count,
+                         out=np.full(self.count.shape, np.nan), where=self.count > 0)
+
+    def to_dataframe(self):
+        # One row per recorded day and resource. Each summarised column holds
+        # the mean over runs, so the charts can read it like the full data, with
+        # its standard deviation, minimum and maximum alongside, then the
+        # histogram quantiles and P_Full.
+        day, resource = np.nonzero(self.count)
+        count = self.count[day, resource]
+        data = {
+            "Day": day,
+            "Resource": np.array(self.resource_names, dtype=object)[resource],
+            "Runs": count,
+        }
+        for column in SUMMARY_COLUMNS:
+            m2 = self.m2[column][day, resource]
+            data[column] = self.mean[column][day, resource]
+            data[f"{column}_Std"] = np.sqrt(np.divide(m2, count - 1, out=np.full(m2.shape, np.nan),
+                                                      where=count > 1))
+            data[f"{column}_Min"] = self.minimum[column][day, resource]
+            data[f"{column}_Max"] = self.maximum[column][day, resource]
+        for column in HISTOGRAM_CAPS:
+            for q in FAN_QUANTILES:
+                data[f"{column}_P{round(q * 100):02d}"] = self.quantile(column, q)[day, resource]
+        data["P_Full"] = self.probability_full()[day, resource]
+        return pd.DataFrame(data)
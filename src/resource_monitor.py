@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+
+RESOURCE_MONITOR_COLUMNS = ["Run_Number", "Day", "Resource", "Daily_Use",
+                            "Total_Capacity", "Available_Capacity", "Queue_Length", "Utilization_Rate"]
+
+# Compact schema every engine's monitor frame is created with. Resource is a
+# categorical over the unit names, cot counts fit int16 (capacity is at most a
+# few dozen), queues and day numbers int32 for long, congested horizons.
+RESOURCE_MONITOR_DTYPES = {
+    "Run_Number": np.int32,
+    "Day": np.int32,
+    "Daily_Use": np.int16,
+    "Total_Capacity": np.int16,
+    "Available_Capacity": np.int16,
+    "Queue_Length": np.int32,
+    "Utilization_Rate": np.float32,
+}
+
+
+# Columnar recorder for the daily resource monitor. Rows are written into
+# preallocated NumPy columns and only turned into a DataFrame once the run ends.
+class ResourceMonitorStore:
+    def __init__(self, resource_names, sim_duration, run_number):
+        self.resource_names = list(resource_names)
+        self.resource_codes = {name: code for code, name in enumerate(self.resource_names)}
+        self.run_number = run_number
+
+        # One row per resource per simulated day is the most monitor() can write
+        n_rows = max(int(sim_duration), 1) * len(self.resource_names)
+        self.day = np.empty(n_rows, dtype=np.int64)
+        self.resource = np.empty(n_rows, dtype=np.int64)
+        self.daily_use = np.empty(n_rows, dtype=np.int64)
+        self.total_capacity = np.empty(n_rows, dtype=np.int64)
+        self.queue_length = np.empty(n_rows, dtype=np.int64)
+        self.size = 0
+
+    def _grow(self):
+        # Only reached if the run outlives sim_duration, double every column
+        for column in ("day", "resource", "daily_use", "total_capacity", "queue_length"):
+            values = getattr(self, column)
+            grown = np.empty(len(values) * 2, dtype=values.dtype)
+            grown[:len(values)] = values
+            setattr(self, column, grown)
+
+    def record(self, day, resource_name, usage, total_capacity, queue_length):
+        i = self.size
+        if i == len(self.day):
+            self._grow()
+
+        self.day[i] = day
+        self.resource[i] = self.resource_codes[resource_name]
+        self.daily_use[i] = usage
+        self.total_capacity[i] = total_capacity
+        self.queue_length[i] = queue_length
+        self.size = i + 1
+
+    def to_dataframe(self):
+        n = self.size
+        return monitor_frame(np.full(n, self.run_number), self.day[:n], self.resource[:n],
+                             self.resource_names, self.daily_use[:n],
+                             self.total_capacity[:n], self.queue_length[:n])
+
+
+def monitor_frame(run_number, day, resource_code, resource_names, daily_use, total_capacity, queue_length):
+    # Single place the resource monitor schema is assembled, for every engine
+    dtypes = RESOURCE_MONITOR_DTYPES
+    daily_use = np.asarray(daily_use).astype(dtypes["Daily_Use"])
+    total_capacity = np.asarray(total_capacity).astype(dtypes["Total_Capacity"])
+    return pd.DataFrame({
+        "Run_Number": np.asarray(run_number).astype(dtypes["Run_Number"]),
+        "Day": np.asarray(day).astype(dtypes["Day"]),
+        "Resource": pd.Categorical.from_codes(resource_code, categories=list(resource_names)),
+        "Daily_Use": daily_use,
+        "Total_Capacity": total_capacity,
+        "Available_Capacity": total_capacity - daily_use,
+        "Queue_Length": np.asarray(queue_length).astype(dtypes["Queue_Length"]),
+        "Utilization_Rate": (daily_use / total_capacity).astype(dtypes["Utilization_Rate"]),
+    }, columns=RESOURCE_MONITOR_COLUMNS)
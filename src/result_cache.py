@@ -0,0 +1,133 @@
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+
+import pandas as pd
+
+from src.parameters import SimulationParameters
+
+logger = logging.getLogger(__name__)
+
+# Bump an engine's version whenever a change alters its output for the same
+# parameters and seed, so results cached by the old code are never reused
+ENGINE_VERSIONS = {"simpy": 1, "batch": 1}
+
+
+def result_cache_key(sim_params, engine, random_state, **options):
+    # sha256 of everything a result depends on. Numbers are normalised to float
+    # so 3 cots and 3.0 cots, as the sidebar may give them, share one entry.
+    # options holds any other run settings that change the output, e.g.
+    # number_of_runs or aggregate.
+    params = SimulationParameters.from_object(sim_params).as_dict()
+    normalised = {name: None if value is None else float(value) for name, value in params.items()}
+    content = {
+        "simulation_parameters": normalised,
+        "random_state": random_state,
+        "engine": engine,
+        "engine_version": ENGINE_VERSIONS[engine],
+        "options": {name: value for name, value in sorted(options.items())},
+    }
+    return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+
+
+# Lock held by creating a file with O_EXCL, which is atomic on every platform
+# and on network file systems, so it also works between server processes. A
+# lock left behind by a crashed process is broken once it is stale_after old.
+class CacheLock:
+    def __init__(self, path, timeout=30, stale_after=120):
+        self.path = path
+        self.timeout = timeout
+        self.stale_after = stale_after
+
+    def __enter__(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                descriptor = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.write(descriptor, str(os.getpid()).encode())
+                os.close(descriptor)
+                return self
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(self.path) > self.stale_after:
+                        logger.warning(f"Breaking stale cache lock {self.path}")
+                        os.remove(self.path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Could not lock the result cache at {self.path}")
+                time.sleep(0.05)
+
+    def __exit__(self, *exc_info):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+# Simulation results on disk as zstd compressed Parquet, one file per key.
+# Files are written under a temporary name and renamed into place, so a reader
+# never sees a partial file and needs no lock. Writers take the lock to evict
+# the least recently used files (by mtime, which get() refreshes) once the
+# cache is over max_bytes.
+class ResultCache:
+    def __init__(self, directory, max_bytes=500 * 2 ** 20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self.lock_path = os.path.join(directory, ".lock")
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.parquet")
+
+    def get(self, key):
+        # The cached frame, or None on a miss
+        path = self.path(key)
+        try:
+            data = pd.read_parquet(path)
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error(f"Unreadable cache entry {path}: {e}")
+            return None
+        return data
+
+    def put(self, key, data):
+        temporary_path = os.path.join(self.directory, f".{key}.{uuid.uuid4().hex}.tmp")
+        try:
+            data.to_parquet(temporary_path, compression="zstd")
+            with CacheLock(self.lock_path):
+                os.replace(temporary_path, self.path(key))
+                self.evict()
+        finally:
+            # Left behind if the write or the replace failed, evict never sees it
+            try:
+                os.remove(temporary_path)
+            except FileNotFoundError:
+                pass
+
+    def evict(self):
+        # Called with the lock held
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".parquet"):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -0,0 +1,65 @@
+import logging
+
+from src.census import build_census
+from src.simulation import Simulate
+from src.warm_up import detect_warm_up, with_warm_up
+
+logger = logging.getLogger(__name__)
+
+
+def scenario_options(pilot_runs=None, census_runs=None):
+    # The run_scenario settings a result depends on, for result_cache_key with
+    # the parameters as they were before the warm-up was detected
+    options = {}
+    if pilot_runs:
+        options["warm_up_pilot_runs"] = pilot_runs
+    if census_runs:
+        options["census_runs"] = census_runs
+    return options
+
+
+def run_scenario(run_function, sim_params, *args, pilot_runs=None, census_runs=None, workers=1, engine="simpy",
+                 random_state=None, cancel_token=None, **kwargs):
+    """Run a scenario with run_replications or run_until_precise, after its pilot runs.
+
+    With pilot_runs the warm-up is first detected from that many pilot runs,
+    and with census_runs every run starts from a steady-state census of that
+    many pilot runs taken at the end of the warm-up, recording from day 0.
+    Everything happens in the calling thread, so a BackgroundRun can run the
+    whole scenario and cancel_token also stops the warm-up pilot runs.
+
+    A census needs a warm-up of at least one day, a ValueError is raised
+    before any run otherwise.
+
+    Returns a dict of the run_function's result, the parameters it ran with,
+    the warm-up in days and the warm-up and census reports (None when not asked for).
+    """
+    warm_up_report = None
+    if pilot_runs:
+        warm_up, warm_up_report = detect_warm_up(sim_params, pilot_runs, workers=workers, engine=engine,
+                                                 random_state=random_state, cancel_token=cancel_token)
+        sim_params = with_warm_up(sim_params, warm_up)
+    # A census start records from day 0 after it
+    warm_up = Simulate(sim_params).warm_up_duration
+
+    census = None
+    census_report = None
+    stopped = cancel_token is not None and cancel_token.cancelled
+    if census_runs and not stopped:
+        if warm_up < 1:
+            raise ValueError(f"A steady-state census is taken at the end of the warm up, which is {warm_up} days. "
+                             "Set a warm up of at least one day or run without the census")
+        census = build_census(sim_params, census_runs, random_state=random_state)
+        census_report = census.report()
+        # The warm up is now in the census, the runs record from the start
+        sim_params = with_warm_up(sim_params, 0)
+
+    result = run_function(sim_params, *args, workers=workers, engine=engine, random_state=random_state,
+                          cancel_token=cancel_token, census=census, **kwargs)
+    return {
+        "result": result,
+        "sim_params": sim_params,
+        "warm_up": warm_up,
+        "warm_up_report": warm_up_report,
+        "census_report": census_report,
+    }
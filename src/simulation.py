@@ -1,105 +1,94 @@
 import os
 import simpy
-import random
 import pandas as pd
 import logging
 
 from modules.logger_configurator import configure_logger
 from modules.read_config import read_config
-
-configure_logger()
-config = read_config('parameters.yaml')
+from src.resource_monitor import ResourceMonitorStore
+from src.parameters import SimulationParameters, first_need_probabilities, cot_stay_means
+from src.random_streams import RandomStreams
+from src.patient_store import PatientStore, QUEUE_TIME_COLUMN
+from src.cot_allocator import CotAllocator
+from src.patient_log import PatientJourneyLog, ADMISSION, TRANSFER, DISCHARGE
 
 logger = logging.getLogger(__name__)
 
-def Simulate(sim_params): #Working**
-    print("Accessing simulation parameters in simulation.py:")
-    
-    for attr_name in dir(sim_params):
-        if not callable(getattr(sim_params, attr_name)) and not attr_name.startswith("__"):
-            # print(f"{attr_name}: {getattr(sim_params, attr_name)}") 
-            globals()[attr_name] = getattr(sim_params, attr_name)
-
-
-
-# Class representing our births requiring additional care.
-class Birth_Patient:
-    def __init__(self, p_id, prob_NICU, prob_HDCU, prob_SCBU):
-        self.id = p_id
-        self.q_time_NICU = 0
-        self.q_time_HDCU = 0
-        self.q_time_SCBU = 0
-        self.NICU_Pat = False
-        self.HDCU_Pat = False
-        self.SCBU_Pat = False
-        self.prob_NICU = prob_NICU
-        self.prob_HDCU = prob_HDCU
-        self.prob_SCBU = prob_SCBU
-        self.nicu_chance = 0
-        self.hdcu_chance = 0
-        self.scbu_chance = 0
-        self.pat_monitor_df = pd.DataFrame()
-
-            
-    def determine_destiny(self, prob_var, var_pat, var_chance):
-        sc = random.uniform(0, 1)
-        if sc < prob_var:
-            setattr(self, var_pat, True)
-            setattr(self, var_chance, sc)
-
-    # NOT NORMALL IN USE DUE TO SEVERE PERFORMANCE ISSUES, ONLY HERE TO MONITOR WHEN NECESSARY        
-    def pat_monitor(self,run_number, day_number):
-        id = self.id 
-        nicu_pat = self.NICU_Pat
-        nicu_prob = self.nicu_chance
-        hdcu_pat = self.HDCU_Pat
-        hdcu_prob = self.hdcu_chance
-        scbu_pat = self.SCBU_Pat
-        scbu_prob = self.scbu_chance
-        rn = run_number
-        dn = day_number
-    
-        # append data to the dataframe
-        
-        self.pat_monitor_df = self.pat_monitor_df.append({"Run_Number": rn,
-                                                        "Day_Number": dn,
-                                                        "Pat_ID": id,
-                                                        "nicu_pat": nicu_pat,
-                                                        "nicu_prob": nicu_prob,
-                                                        "hdcu_pat": hdcu_pat,
-                                                        "hdcu_prob": hdcu_prob,
-                                                        "scbu_pat": scbu_pat,
-                                                        "scbu_prob": scbu_prob},
-                                                        ignore_index=True)
-
-    def write_pat_details(self):
-        with open("./patient_monitor_data.csv", "a", newline='') as f:
-            writer = csv.writer(f, delimiter=",")    
-            for index, row in self.pat_monitor_df.iterrows():
-                writer.writerow(row)
+# 'thinned' only creates patients for the births that need a cot,
+# 'per_birth' creates one for every birth and decides its destiny afterwards
+ARRIVAL_MODES = ('thinned', 'per_birth')
 
+def Simulate(sim_params):
+    # Freeze the parameters for a set of runs. Nothing is written to module
+    # globals any more, every NCCU_Model carries its own SimulationParameters.
+    return SimulationParameters.from_object(sim_params)
 
-# Class representing our model of Neonatal Unit.
 
-class NamedResource(simpy.PriorityResource):
-    def __init__(self, *args, name=None, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.name = name
 
+# Class representing our model of Neonatal Unit.
 
 class NCCU_Model:
 
 
-    def __init__(self, sim_params_instance):
+    def __init__(self, sim_params_instance, run_number=None, streams=None, arrival_mode='thinned',
+                 trace_patients=False, census=None):
+        self.sim_params = SimulationParameters.from_object(sim_params_instance)
+        params = self.sim_params
+
+        if arrival_mode not in ARRIVAL_MODES:
+            raise ValueError(f"Unknown arrival mode: {arrival_mode}")
+        self.arrival_mode = arrival_mode
+
+        # Every replication draws from its own streams, fresh entropy unless given
+        self.streams = streams if streams is not None else RandomStreams()
+
+        # Look up the constants used on the hot path once, rather than per patient
+        self.sim_duration = params.sim_duration
+        self.warm_up_duration = params.warm_up_duration
+        self.day_births_inter = params.day_births_inter
+        self.chance_need_NICU = params.chance_need_NICU
+        self.chance_need_HDCU = params.chance_need_HDCU
+        self.chance_need_SCBU = params.chance_need_SCBU
+        p_NICU, p_HDCU, p_SCBU = first_need_probabilities(params)
+        self.need_probabilities = [p_NICU, p_HDCU, p_SCBU, 1 - p_NICU - p_HDCU - p_SCBU]
+        # Mean stay for the type of cot a patient is given
+        self.stay_means = cot_stay_means(params)
+
+        # Chances of needing another type of cot after leaving each one
+        self.next_chances = {
+            'NICU': ((params.chance_need_HDCU_after_NICU, 'HDCU_Pat', 'hdcu_chance'),
+                     (params.chance_need_SCBU_after_NICU, 'SCBU_Pat', 'scbu_chance')),
+            'HDCU': ((params.chance_need_NICU_after_HDCU, 'NICU_Pat', 'nicu_chance'),
+                     (params.chance_need_SCBU_after_HDCU, 'SCBU_Pat', 'scbu_chance')),
+            'SCBU': ((params.chance_need_NICU_after_SCBU, 'NICU_Pat', 'nicu_chance'),
+                     (params.chance_need_HDCU_after_SCBU, 'HDCU_Pat', 'hdcu_chance')),
+        }
 
         self.env = simpy.Environment()
         self.patient_counter = 0
 
-        self.NICU = NamedResource(self.env, capacity=number_of_NICU_cots, name='NICU')
-        self.HDCU = NamedResource(self.env, capacity=number_of_HDCU_cots, name='HDCU')
-        self.SCBU = NamedResource(self.env, capacity=number_of_SCBU_cots, name='SCBU')
+        # Every materialised birth is a row in the patient store, sized for the expected births
+        expected_patients = self.sim_duration * self.day_births_inter * 1.2
+        if arrival_mode == 'thinned':
+            expected_patients *= 1 - self.need_probabilities[-1]
+        self.patients = PatientStore(expected_patients)
+
+        # One allocator hands out cots across all three units
+        self.cots = CotAllocator(self.env, {'NICU': params.number_of_NICU_cots,
+                                            'HDCU': params.number_of_HDCU_cots,
+                                            'SCBU': params.number_of_SCBU_cots})
+        self.NICU = self.cots.units['NICU']
+        self.HDCU = self.cots.units['HDCU']
+        self.SCBU = self.cots.units['SCBU']
         
-        self.run_number = number_of_runs#####
+        # Replication runners number each run, a lone model keeps the old behaviour
+        self.run_number = run_number if run_number is not None else params.number_of_runs
+
+        # Opt-in log of every admission, transfer and discharge
+        self.patient_log = PatientJourneyLog(self.run_number) if trace_patients else None
+
+        # Steady-state census to start from instead of empty units, see src.census
+        self.census = census
 
         self.mean_q_time_cot = 0
 
@@ -114,6 +103,10 @@ class NCCU_Model:
         self.results_df["Q_Time_SCBU"] = []
         self.results_df.set_index("P_ID", inplace=True)
 
+        # Daily resource rows are written column-wise and only turned into
+        # resource_monitor_df once run() has finished
+        self.resource_monitor_store = ResourceMonitorStore(
+            [self.NICU.name, self.HDCU.name, self.SCBU.name], self.sim_duration, self.run_number)
         self.resource_monitor_df = pd.DataFrame()
         self.results_df["Run_Number"] = []
         self.results_df["Day"] = []
@@ -131,26 +124,25 @@ class NCCU_Model:
     def generate_birth_arrivals(self):
         # logger.info("#>Enter generate_birth_arrivals")   
         # Keep generating until the simulation duration is reached
-        for _ in range(sim_duration):
+        chance_need_NICU = self.chance_need_NICU
+        chance_need_HDCU = self.chance_need_HDCU
+        chance_need_SCBU = self.chance_need_SCBU
+        uniform = self.streams.uniform
+        patients = self.patients
+        for _ in range(self.sim_duration):
             # With day as our currency for timestamps here we need to generate multiple agents per day
-            sampled_num = round(random.expovariate(1.0 / day_births_inter), 0)
-            sampled_num = int(sampled_num)
+            sampled_num = self.streams.daily_births(self.day_births_inter)
             for i in range(sampled_num):
                 # Increment the patient counter by 1
                 self.patient_counter += 1
 
-                # Create a new patient instance of the Birth_Patient class,
+                # Add a row for the new patient to the patient store,
                 # and give the patient an ID determined by the patient counter
-                birth = Birth_Patient(self.patient_counter, chance_need_NICU, chance_need_HDCU, chance_need_SCBU)
+                birth = patients.add(self.patient_counter)
 
-                birth.determine_destiny(chance_need_NICU, 'NICU_Pat', 'nicu_chance')
-                birth.determine_destiny(chance_need_HDCU, 'HDCU_Pat', 'hdcu_chance')
-                birth.determine_destiny(chance_need_SCBU, 'SCBU_Pat', 'scbu_chance')
-
-                # THIS MONITORING SIGNIFICANTLY DEGRADES PERFORMANCE ONLY UN_COMMENT
-                # TEMPORARILY TO CHECK VARIABLE ASSIGNMENTS
-                # birth.pat_monitor(self.run_number, self.env.now)
-                # birth.write_pat_details()
+                patients.determine_destiny(birth, chance_need_NICU, 'NICU_Pat', 'nicu_chance', uniform())
+                patients.determine_destiny(birth, chance_need_HDCU, 'HDCU_Pat', 'hdcu_chance', uniform())
+                patients.determine_destiny(birth, chance_need_SCBU, 'SCBU_Pat', 'scbu_chance', uniform())
 
                 # Get the SimPy environment to run the manage_birth_resource method
                 # with this patient
@@ -160,180 +152,137 @@ class NCCU_Model:
             yield self.env.timeout(1)
             # logger.info("#>Exit generate_birth_arrivals")   
 
+    def generate_thinned_birth_arrivals(self):
+        # Same births as generate_birth_arrivals, but each day's births are split
+        # by first need in one multinomial draw and only babies needing a cot
+        # become patients and SimPy processes
+        need_columns = (('NICU_Pat', 'nicu_chance', self.chance_need_NICU),
+                        ('HDCU_Pat', 'hdcu_chance', self.chance_need_HDCU),
+                        ('SCBU_Pat', 'scbu_chance', self.chance_need_SCBU))
+        need_probabilities = self.need_probabilities
+        uniform = self.streams.uniform
+        patients = self.patients
+        for _ in range(self.sim_duration):
+            sampled_num = self.streams.daily_births(self.day_births_inter)
+            first_patient_id = self.patient_counter
+            self.patient_counter += sampled_num
+
+            for i, need in enumerate(self.streams.daily_needs(sampled_num, need_probabilities)):
+                birth = patients.add(first_patient_id + i + 1)
+                var_pat, var_chance, prob_var = need_columns[need]
+                # The destiny draw of a baby known to need this cot is uniform below its chance
+                patients.determine_destiny(birth, prob_var, var_pat, var_chance, uniform() * prob_var)
+
+                self.env.process(self.manage_birth_resource(birth))
+
+            yield self.env.timeout(1)
+
 
 
 
             
-    def process_cot_request(self, cot_request, birth, start_cot_wait, avg_stay, next_chances, cot_pat):
-        with cot_request:
-            # Record the time the patient finished queuing
-            end_wait = self.env.now
+    def process_cot_request(self, birth, start_cot_wait, avg_stay, next_chances, cot_pat):
+        # Record the time the patient finished queuing
+        end_wait = self.env.now
 
-            # Calculate the time this patient spent queuing for a cot and
-            # store in the patient's attribute
-            birth.q_time_cot = end_wait - start_cot_wait
+        # Calculate the time this patient spent queuing for a cot and
+        # store it in the patient's row
+        q_time = end_wait - start_cot_wait
+        getattr(self.patients, QUEUE_TIME_COLUMN[cot_pat])[birth] = q_time
 
-            # Randomly sample the time the patient will spend in cot
-            sampled_cot_duration = round(random.expovariate(1.0 / avg_stay), 0)
-            sampled_cot_duration = int(sampled_cot_duration)
+        # Randomly sample the time the patient will spend in cot
+        sampled_cot_duration = self.streams.stay_length(avg_stay)
 
-            # Freeze this function until that time has elapsed
-            yield self.env.timeout(sampled_cot_duration)
+        # Freeze this function until that time has elapsed
+        yield self.env.timeout(sampled_cot_duration)
 
-            # reset cot flagv
-            setattr(birth, cot_pat, False)
+        # reset cot flag
+        getattr(self.patients, cot_pat)[birth] = False
 
-            #calculate the new chances to need the other types of resource having exited one
-            for chance, pat, chance_name in next_chances:
-                birth.determine_destiny(chance, pat, chance_name)
-                if not getattr(birth, pat):
-                    break
+        #calculate the new chances to need the other types of resource having exited one
+        for chance, pat, chance_name in next_chances:
+            self.patients.determine_destiny(birth, chance, pat, chance_name, self.streams.uniform())
+            if not getattr(self.patients, pat)[birth]:
+                break
 
 
     # A method that models the processes for births and assigning resources.
-    # The method needs to be passed a patient who may require resources
+    # The method needs to be passed the patient store row of a patient who may require resources
     def manage_birth_resource(self, birth):
+        patients = self.patients
         # Record the time the patient started queuing for a cot
         start_cot_wait = self.env.now
-        # logger.info("#>enter manage_birth_resource block")  
 
         # Release immediately any agents that dont require any resource
-        if not (birth.NICU_Pat or birth.HDCU_Pat or birth.SCBU_Pat): 
+        if not patients.needs_cot(birth):
             return
 
-        # Open a while so that any required cot can be processed while needed
-        while birth.NICU_Pat or birth.HDCU_Pat or birth.SCBU_Pat:
-
-            #"""Process NICU Requirement"""
-            if birth.NICU_Pat == True:
-                # Request a NICU cot only
-                req = self.NICU.request()
-                yield req
-                yield from self.process_cot_request(
-                    req, # self.NICU.request(), ####> day_births_inter** will raise issues
-                    birth,
-                    start_cot_wait,
-                    avg_NICU_stay,
-                    [
-                        (chance_need_HDCU_after_NICU, 'HDCU_Pat', 'hdcu_chance'),
-                        (chance_need_SCBU_after_NICU, 'SCBU_Pat', 'scbu_chance')
-                    ],
-                    'NICU_Pat'
-                )
-                self.NICU.release(req)
-                # logger.info("#>exiting manage_birth_resource")  
-                break  
-            
-
-            # Reinitialise the cot wait on exiting the previous Cot
-            start_cot_wait = self.env.now
-
-            #"""Process HDU Requirement"""
-            
-            
-            if birth.HDCU_Pat:
-
-                hdu_req = self.HDCU.request(priority=0)
-                nicu_req = self.NICU.request(priority=1)
-
-                requests = {self.HDCU: hdu_req, self.NICU: nicu_req}
-
-                # Make a request for each type of cot
-                results = yield simpy.AnyOf(self.env, requests.values())
-
-                # Check which request was successful and cancel the other
-                used_req = next(iter(results))  # The request that succeeded
-                used_res = next(res for res, req in requests.items() if req == used_req)  # The resource for that request
-
-                for res, req in requests.items():
-                    if req != used_req:
-                        req.cancel()  # Cancel the unused request
-                        res.release(req)
-
-                # Now process the used request
-                yield from self.process_cot_request(
-                    used_req,
-                    birth,
-                    start_cot_wait,
-                    avg_HDCU_stay if used_res == self.HDCU else avg_NICU_stay,
-                    [
-                        (chance_need_NICU_after_HDCU, 'NICU_Pat', 'nicu_chance'),
-                        (chance_need_SCBU_after_HDCU, 'SCBU_Pat', 'scbu_chance')
-                    ],
-                    'HDCU_Pat'
-                )
-                used_res.release(used_req)
-
-                break
+        # The most intensive care needed decides the level requested. The
+        # allocator gives the patient a cot at that level, or steps them up to
+        # a more intensive unit when it has the first free cot.
+        if patients.NICU_Pat[birth]:
+            level = 'NICU'
+        elif patients.HDCU_Pat[birth]:
+            level = 'HDCU'
+        else:
+            level = 'SCBU'
+
+        unit_name = yield self.cots.request(level)
+
+        patient_log = self.patient_log
+        if patient_log is not None:
+            p_id = int(patients.p_id[birth])
+            patient_log.record(self.env.now, p_id, ADMISSION if unit_name == level else TRANSFER,
+                               level, unit_name, self.env.now - start_cot_wait)
+
+        yield from self.process_cot_request(
+            birth,
+            start_cot_wait,
+            self.stay_means[unit_name],
+            self.next_chances[level],
+            level + '_Pat'
+        )
+        self.cots.release(unit_name)
+
+        if patient_log is not None:
+            patient_log.record(self.env.now, p_id, DISCHARGE, level, unit_name)
+
+    def start_from_census(self):
+        # Fills the units from one snapshot of the census before the first
+        # births. Babies in a cot keep it for the rest of their stay; babies
+        # queuing request a cot like a new birth and get a stay on admission.
+        index = self.streams.census_snapshot(len(self.census))
+        for unit_name, days_left, late in self.census.occupants(index):
+            self.env.process(self.census_stay(unit_name, days_left, late))
+        for level, waiting in self.census.queued(index):
+            for _ in range(waiting):
+                self.patient_counter += 1
+                birth = self.patients.add(self.patient_counter)
+                getattr(self.patients, level + '_Pat')[birth] = True
+                self.env.process(self.manage_birth_resource(birth))
 
-            # Reinitialise the cot wait on exiting the previous Cot
-            start_cot_wait = self.env.now
-        
-            #"""Process SCBU Requirement"""
-            if birth.SCBU_Pat:
-                
-                scbu_req = self.SCBU.request(priority=0)
-                hdu_req = self.HDCU.request(priority=1)
-                nicu_req = self.NICU.request(priority=2)
-
-                requests = {self.SCBU: scbu_req, self.HDCU: hdu_req, self.NICU: nicu_req}
-
-                # Make a request for each type of cot
-                results = yield simpy.AnyOf(self.env, requests.values())
-
-                # Check which request was successful and cancel the other
-                used_req = next(iter(results))  # The request that succeeded
-                used_res = next(res for res, req in requests.items() if req == used_req)  # The resource for that request
-
-                for res, req in requests.items():
-                    if req != used_req:
-                        req.cancel()  # Cancel the unused request
-                        res.release(req)
-
-                # Now process the used request
-                yield from self.process_cot_request(
-                    used_req,
-                    birth,
-                    start_cot_wait,
-                    avg_HDCU_stay if used_res == self.HDCU else avg_NICU_stay,
-                    [
-                        (chance_need_NICU_after_SCBU, 'NICU_Pat', 'nicu_chance'),
-                        (chance_need_HDCU_after_SCBU, 'HDCU_Pat', 'hdcu_chance')
-                    ],
-                    'SCBU_Pat'
-                )
-                used_res.release(used_req)
+    def census_stay(self, unit_name, days_left, late):
+        # A census occupant is in their own unit, which always has the cot free
+        # at the start. A late release happens after that day's monitor, as the
+        # batched engine the census comes from does it.
+        yield self.cots.request(unit_name)
+        yield self.env.timeout(days_left)
+        if late:
+            yield self.env.timeout(0)
+        self.cots.release(unit_name)
 
-                break
-            
-            # Reinitialise the cot wait on exiting the previous Cot
-            start_cot_wait = self.env.now
-            
     def monitor(self, resource):
         # logger.info("#>Enter Monitor")   
         
-        if self.env.now > warm_up_duration:
-            day = resource._env.now  # current simulation time
-            usage = resource.count # resource count
-            total_capacity = resource.capacity # resource capacity
-            available_capacity = total_capacity - usage # available resource capacity
+        if self.env.now > self.warm_up_duration:
+            day = self.env.now  # current simulation time
+            usage = resource.count # cots in use
+            total_capacity = resource.capacity # unit capacity
             resource_name = resource.name # What resource type?
-            queue_length = len(resource.queue) # number of waiting
-
-            # append data to the dataframe
-            new_row = pd.DataFrame({
-                "Run_Number": [self.run_number],
-                "Day": [day],
-                "Resource": [resource_name],
-                "Daily_Use": [usage],
-                "Total_Capacity": [total_capacity],
-                "Available_Capacity": [available_capacity],
-                "Queue_Length": [queue_length]
-                })
-
-            self.resource_monitor_df = pd.concat([self.resource_monitor_df, new_row], ignore_index=True)
-            # logger.info(self.resource_monitor_df)
-            # logger.info("Exit Monitor")
+            queue_length = resource.queue_length # number waiting who could use this unit
+
+            # available capacity is derived when the store is turned into a dataframe
+            self.resource_monitor_store.record(day, resource_name, usage, total_capacity, queue_length)
 
         
     def monitor_resource(self, resource):
@@ -367,8 +316,15 @@ class NCCU_Model:
     def run(self):
         # logger.info("#> Enter Run Block")   
         
+        # Census occupants take their cots before anyone is born
+        if self.census is not None:
+            self.start_from_census()
+
         # Start entity generators
-        self.env.process(self.generate_birth_arrivals())
+        if self.arrival_mode == 'thinned':
+            self.env.process(self.generate_thinned_birth_arrivals())
+        else:
+            self.env.process(self.generate_birth_arrivals())
 
         # logger.info("#>#> generate birth arrivals in Run Block{}")  
 
@@ -376,8 +332,10 @@ class NCCU_Model:
         
         # logger.info("#> daily scheduler complete") 
         # Run simulation
-        self.env.run(until=sim_duration)
+        self.env.run(until=self.sim_duration)
 
+        # Build the monitor dataframe once from the columnar store
+        self.resource_monitor_df = self.resource_monitor_store.to_dataframe()
         
         
         # Write run results to file
@@ -1 +1,11 @@
-import streamlit as st
+# Levels of neonatal care, most intensive first
+UNIT_NAMES = ('NICU', 'HDCU', 'SCBU')
+
+# Cots a patient needing each level of care can be placed in, in order of
+# preference. When their own level is full patients step up to a more
+# intensive cot, never down.
+ELIGIBLE_UNITS = {
+    'NICU': ('NICU',),
+    'HDCU': ('HDCU', 'NICU'),
+    'SCBU': ('SCBU', 'HDCU', 'NICU'),
+}
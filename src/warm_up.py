@@ -0,0 +1,99 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from src.replication import run_replications
+from src.simulation import Simulate
+
+logger = logging.getLogger(__name__)
+
+WARM_UP_REPORT_COLUMNS = ["Resource", "Warm_Up", "MSER", "Reliable", "Pilot_Runs", "Pilot_Days"]
+
+# Days averaged into each batch mean, the 5 of MSER-5
+MSER_BATCH_SIZE = 5
+
+# Pilot runs are seeded apart from the scenario's own runs, so the warm-up is
+# not chosen on the same random numbers as the results it is applied to
+PILOT_STREAM = 1
+
+
+def mser(series, batch_size=MSER_BATCH_SIZE):
+    # MSER truncation point of a per-day series: the number of leading days d
+    # minimising the variance of the mean of what is left, sum((y - mean)^2) / (n - d)^2,
+    # over the batch means of batch_size days. Only the first half of the
+    # series is searched, as the statistic is unstable with few batches left.
+    # Returns the number of days to drop, the minimum, and whether it fell
+    # short of the halfway limit. If it did not, the series has probably not
+    # settled down yet and a longer pilot is needed.
+    values = np.asarray(series, dtype=np.float64)
+    n_batches = len(values) // batch_size
+    if n_batches < 2:
+        return 0, np.nan, False
+    batch_means = values[:n_batches * batch_size].reshape(n_batches, batch_size).mean(axis=1)
+
+    # Sums over every tail batch_means[d:] at once
+    tail_count = np.arange(n_batches, 0, -1)
+    tail_sum = np.cumsum(batch_means[::-1])[::-1]
+    tail_square_sum = np.cumsum(batch_means[::-1] ** 2)[::-1]
+    statistic = (tail_square_sum - tail_sum ** 2 / tail_count) / tail_count ** 2
+
+    limit = n_batches // 2
+    best = int(np.argmin(statistic[:limit + 1]))
+    return best * batch_size, float(statistic[best]), best < limit
+
+
+def detect_warm_up(sim_params, pilot_runs=10, pilot_duration=None, batch_size=MSER_BATCH_SIZE,
+                   workers=1, engine="simpy", random_state=None, cancel_token=None):
+    """Estimate the warm-up a scenario needs from pilot runs, by MSER-5.
+
+    The pilot runs start from empty units with no warm-up and run for
+    pilot_duration days (the scenario's sim_duration by default). Occupancy
+    is averaged over them day by day as they finish, and each unit's average
+    is truncated by mser. The scenario's warm-up is the longest of the units'.
+
+    Returns the warm-up in days and a report with each unit's truncation point.
+    If any unit never settled within the first half of the pilot, its row is
+    not Reliable and the scenario's own warm_up_duration is returned instead.
+    cancel_token stops the pilot runs as it does for run_replications.
+    """
+    snapshot = Simulate(sim_params)
+    if pilot_duration is None:
+        pilot_duration = snapshot.sim_duration
+    pilot_params = snapshot.replace(warm_up_duration=0, sim_duration=pilot_duration)
+    pilot_state = None if random_state is None else (random_state, PILOT_STREAM)
+
+    # The summary holds the mean occupancy of every day over the pilot runs
+    summary = run_replications(pilot_params, pilot_runs, workers=workers, engine=engine,
+                               aggregate=True, random_state=pilot_state, cancel_token=cancel_token)
+
+    rows = []
+    for resource, resource_summary in summary.groupby("Resource", sort=False):
+        occupancy = resource_summary.sort_values("Day")["Daily_Use"]
+        warm_up, statistic, reliable = mser(occupancy, batch_size)
+        # The monitor records from day 1, so dropping d days leaves day d + 1 onwards
+        rows.append([resource, warm_up, statistic, reliable, pilot_runs, pilot_duration])
+    report = pd.DataFrame(rows, columns=WARM_UP_REPORT_COLUMNS)
+
+    warm_up = chosen_warm_up(report, snapshot.warm_up_duration)
+    if report.empty or not report["Reliable"].all():
+        logger.warning(f"Occupancy had not settled within {pilot_duration // 2} days of the pilot runs, "
+                       f"keeping the warm up of {warm_up} days")
+    else:
+        logger.info(f"Detected a warm up of {warm_up} days from {pilot_runs} pilot runs")
+    return warm_up, report
+
+
+def chosen_warm_up(report, configured_warm_up):
+    # The warm-up a detect_warm_up report gives: the longest unit's, or the
+    # configured one unless every unit settled
+    if report.empty or not report["Reliable"].all():
+        return configured_warm_up
+    return int(report["Warm_Up"].max())
+
+
+def with_warm_up(sim_params, warm_up):
+    # The scenario with a new warm-up and the same number of recorded days
+    snapshot = Simulate(sim_params)
+    collected_days = snapshot.sim_duration - snapshot.warm_up_duration
+    return snapshot.replace(warm_up_duration=warm_up, sim_duration=warm_up + collected_days)